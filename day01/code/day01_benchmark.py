@@ -0,0 +1,94 @@
+import os
+import sys
+import random
+import time
+import argparse
+import tempfile
+
+from day01_part2 import CalibrationDoc, TEXT_DIGITS, regex
+
+
+def write_lines(fptr, line_count, line_length, seed):
+    # Random letters with the odd digit or digit word mixed in; every line
+    # holds at least one digit so all engines accept it.
+    generator = random.Random(seed)
+    words = list(TEXT_DIGITS) + [str(digit) for digit in range(10)]
+    for _ in range(line_count):
+        parts = []
+        length = 0
+        while length < line_length:
+            if generator.random() < 0.2:
+                part = generator.choice(words)
+            else:
+                part = ''.join(generator.choice('abcdefghijklmnopqrstuvwxyz')
+                               for _ in range(generator.randint(1, 6)))
+            parts.append(part)
+            length += len(part)
+        parts.insert(generator.randint(0, len(parts)), str(generator.randint(1, 9)))
+        fptr.write(''.join(parts))
+        fptr.write('\n')
+
+
+def time_engine(filename, engine, repeat):
+    best = None
+    for _ in range(repeat):
+        cal_doc = CalibrationDoc()
+        start = time.perf_counter()
+        cal_doc.extract_values_from_doc(filename, False, engine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, cal_doc.calibration_values
+
+
+def benchmark_engines(filename, engines, repeat):
+    baseline = None
+    expected = None
+    for engine in engines:
+        elapsed, value = time_engine(filename, engine, repeat)
+        if expected is None:
+            expected = value
+            baseline = elapsed
+        elif value != expected:
+            print(f'Error: the {engine} engine disagrees with the {engines[0]} engine')
+            sys.exit(0)
+        print(f'  {engine:9}: {elapsed:.3f}s ({baseline / elapsed:.1f}x)')
+
+
+def parse_commandline():
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(description='Time day01 part 2 engines against the regex engine')
+
+    parser.add_argument('-n', '--lines', type=int, default=200000,
+                        help='Number of random lines')
+
+    parser.add_argument('-l', '--length', type=str, default='40,400',
+                        help='Comma separated line lengths to time')
+
+    parser.add_argument('-e', '--engines', type=str, default='regex,automaton,scan,mmap',
+                        help='Comma separated engines, the first is the baseline')
+
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Keep the best of this many runs')
+
+    parser.add_argument('--seed', type=int, default=2023,
+                        help='Seed for the random lines')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_commandline()
+    engines = args.engines.split(',')
+    if 'regex' in engines and regex is None:
+        print("Error: the 'regex' module is required for the regex engine")
+        sys.exit(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for line_length in [int(length) for length in args.length.split(',')]:
+            filename = os.path.join(directory, f'values_{line_length}.txt')
+            with open(filename, 'w') as fptr:
+                write_lines(fptr, args.lines, line_length, args.seed)
+            print(f'{args.lines} lines of about {line_length} characters')
+            benchmark_engines(filename, engines, args.repeat)
+
+if __name__ == '__main__':
+    main()
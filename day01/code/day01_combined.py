@@ -0,0 +1,184 @@
+import sys
+import argparse
+from collections import deque
+
+VOCABULARIES = {}
+VOCABULARIES['digits'] = {str(digit): digit for digit in range(10)}
+VOCABULARIES['english'] = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+                           'six': 6, 'seven': 7, 'eight': 8, 'nine': 9}
+
+
+def read_vocabulary(filename):
+    # One "word value" pair per line, e.g. "eins 1"; values are single digits
+    words = {}
+    try:
+        with open(filename, 'r') as fptr:
+            for line in fptr:
+                fields = line.split()
+                if not fields:
+                    continue
+                if (len(fields) != 2 or not fields[1].isdigit() or
+                    int(fields[1]) > 9):
+                    print(f'Error: bad vocabulary entry {line.rstrip()} in {filename}')
+                    sys.exit(0)
+                words[fields[0]] = int(fields[1])
+
+    except IOError:
+        print(f"Error: Could not open \'{filename}\'")
+        sys.exit(0)
+    return words
+
+
+class VocabularyAutomaton():
+    # The union of every part's vocabulary compiled into one trie with
+    # Aho-Corasick failure links.  Each state records, per part, the value
+    # and length of the longest and of the shortest word of that part ending
+    # there: the longest gives the earliest start and the shortest the
+    # latest, so a single left to right pass finds the words that start
+    # first and last for every part at once, even when one word contains
+    # another.
+    def __init__(self, parts):
+        self._part_count = len(parts)
+        goto = [{}]
+        words = [None]
+        depth = [0]
+        for part, vocabulary in enumerate(parts):
+            for word, value in vocabulary.items():
+                state = 0
+                for ch in word:
+                    if ch not in goto[state]:
+                        goto.append({})
+                        words.append(None)
+                        depth.append(depth[state] + 1)
+                        goto[state][ch] = len(goto) - 1
+                    state = goto[state][ch]
+                if words[state] is None:
+                    words[state] = [-1] * len(parts)
+                words[state][part] = value
+
+        alphabet = set(ch for vocabulary in parts for word in vocabulary for ch in word)
+        fail = [0] * len(goto)
+        delta = [dict(goto[0]) for _ in goto]
+        out = [None] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            own = words[state] or [-1] * len(parts)
+            inherited = out[fail[state]] or [None] * len(parts)
+            matches = []
+            for value, inherited_match in zip(own, inherited):
+                if value < 0:
+                    matches.append(inherited_match)
+                elif inherited_match is None:
+                    matches.append((value, depth[state], value, depth[state]))
+                else:
+                    matches.append((value, depth[state]) + inherited_match[2:])
+            if any(match is not None for match in matches):
+                out[state] = tuple(matches)
+            for ch in alphabet:
+                if ch in goto[state]:
+                    child = goto[state][ch]
+                    fail[child] = delta[fail[state]].get(ch, 0) if state else 0
+                    delta[state][ch] = child
+                    queue.append(child)
+                else:
+                    delta[state][ch] = delta[fail[state]].get(ch, 0)
+        self._delta = delta
+        self._out = out
+
+    def first_and_last(self, line):
+        delta = self._delta
+        out = self._out
+        # Ties on the start position go to the longer word
+        first = [-1] * self._part_count
+        last = [-1] * self._part_count
+        first_start = [len(line)] * self._part_count
+        last_start = [-1] * self._part_count
+        state = 0
+        for position, ch in enumerate(line):
+            state = delta[state].get(ch, 0)
+            matches = out[state]
+            if matches is not None:
+                for part, match in enumerate(matches):
+                    if match is None:
+                        continue
+                    start = position - match[1] + 1
+                    if start <= first_start[part]:
+                        first_start[part] = start
+                        first[part] = match[0]
+                    start = position - match[3] + 1
+                    if start >= last_start[part]:
+                        last_start[part] = start
+                        last[part] = match[2]
+        return first, last
+
+
+class CalibrationDoc():
+    def __init__(self, parts):
+        self._automaton = VocabularyAutomaton(parts)
+        self.calibration_values = [0] * len(parts)
+        self.skipped_lines = [0] * len(parts)
+
+    def extract_values_from_doc(self, filename, debug):
+        sums = [0] * len(self.calibration_values)
+        skipped = [0] * len(self.calibration_values)
+        try:
+            with open(filename, 'r') as fptr:
+                for line in fptr:
+                    if debug:
+                        print (line, end='')
+                    first, last = self._automaton.first_and_last(line)
+                    for part, tens_digit in enumerate(first):
+                        if tens_digit < 0:
+                            skipped[part] += 1
+                            continue
+                        value = tens_digit * 10 + last[part]
+                        if debug:
+                            print(f'Part {part + 1} Value = {value}')
+                        sums[part] += value
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        self.calibration_values = sums
+        self.skipped_lines = skipped
+
+    def print_cal_values(self):
+        for part, value in enumerate(self.calibration_values):
+            print (f'Part {part + 1} Calibration Value = {value}')
+            if self.skipped_lines[part]:
+                print (f'  Skipped {self.skipped_lines[part]} line(s) without a digit')
+
+
+def parse_commandline():
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(description='Compute both calibration values in one pass')
+
+    parser.add_argument('-v', '--values', type=str,
+                        help='Filename for the calibration values')
+
+    parser.add_argument('-w', '--words', type=str, action='append', default=[],
+                        help='Extra "word value" table to add to the part 2 vocabulary')
+
+    parser.add_argument('-d', '--debug',
+                        action="store_true",
+                        help='Turn on verbosity')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_commandline()
+    part1 = dict(VOCABULARIES['digits'])
+    part2 = dict(VOCABULARIES['digits'])
+    part2.update(VOCABULARIES['english'])
+    for filename in args.words:
+        part2.update(read_vocabulary(filename))
+
+    cal_doc = CalibrationDoc([part1, part2])
+    cal_doc.extract_values_from_doc(args.values, args.debug)
+    cal_doc.print_cal_values()
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,128 @@
 import sys
+import os
 import math
+import mmap
 import re
+import time
 import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUMPY_CHUNK_SIZE = 1 << 22
+MMAP_BLOCK_SIZE = 1 << 20
+
+
+class DigitScanner():
+    # Finds the tens digit scanning from the left and the ones digit scanning
+    # from the right, stopping at the first hit in each direction.  Mapped
+    # buffers are searched with one compiled bytes pattern per line instead,
+    # so the per-byte work stays in C: a lazy run stops at the first digit,
+    # captured in a lookahead, and a greedy run then backtracks from the end
+    # of the line to the last one.
+    def __init__(self, digits='0123456789'):
+        self._digits = frozenset(digits)
+        self._byte_values = {digit.encode('ascii'): int(digit) for digit in digits}
+        digit_class = b'[' + re.escape(digits.encode('ascii')) + b']'
+        self._byte_lines = re.compile(rb'^[^\n]*?(?=(' + digit_class + rb'))[^\n]*(' +
+                                      digit_class + b')', re.MULTILINE)
+
+    def first(self, line):
+        digits = self._digits
+        for ch in line:
+            if ch in digits:
+                return int(ch)
+        return -1
+
+    def last(self, line):
+        digits = self._digits
+        for stop in range(len(line) - 1, -1, -1):
+            if line[stop] in digits:
+                return int(line[stop])
+        return -1
+
+    def first_and_last(self, line):
+        first = self.first(line)
+        if first < 0:
+            return first, first
+        return first, self.last(line)
+
+    def first_and_last_in_buffer(self, buf, start, stop):
+        match = self._byte_lines.search(buf, start, stop)
+        if match is None:
+            return -1, -1
+        return self._byte_values[match.group(1)], self._byte_values[match.group(2)]
+
+    def sum_block(self, block):
+        # Sums every line of block holding a digit and counts those lines
+        values = self._byte_values
+        total = 0
+        pairs = self._byte_lines.findall(block)
+        for first, last in pairs:
+            total += values[first] * 10 + values[last]
+        return total, len(pairs)
+
+
+class CachedMatcher():
+    # Bounded LRU cache in front of a matcher, keyed on the line content,
+    # for feeds where many devices emit identical lines.
+    def __init__(self, matcher, size):
+        self._matcher = matcher
+        self._size = size
+        self._digits = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def first_and_last(self, line):
+        digits = self._digits.get(line)
+        if digits is not None:
+            self._digits.move_to_end(line)
+            self.hits += 1
+            return digits
+
+        self.misses += 1
+        digits = self._matcher.first_and_last(line)
+        self._digits[line] = digits
+        if len(self._digits) > self._size:
+            self._digits.popitem(last=False)
+        return digits
+
+    @property 
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return f'Cache hits={self.hits} misses={self.misses} hit rate={self.hit_rate:.1%}'
+
 
 class CalibrationDoc():
     def __init__(self):
         self.calibration_values = 0
+        self.cache_size = 0
+
+    def extract_values_from_doc(self, filename, debug, engine='regex'):
+        if filename == '-':
+            self.extract_values_from_stream(sys.stdin, debug,
+                                            self.build_matcher(engine))
+            return
+        if engine == 'numpy':
+            self.warn_cache_unused(engine)
+            self.extract_values_with_numpy(filename, debug)
+            return
+        if engine == 'mmap':
+            self.extract_values_from_mmap(filename, debug,
+                                          self.build_matcher(engine))
+            return
+        if engine != 'regex':
+            self.extract_values_with_matcher(filename, debug,
+                                             self.build_matcher(engine))
+            return
+        self.warn_cache_unused(engine)
 
-    def extract_values_from_doc(self, filename, debug):
         sum = 0
         try:
             with open(filename, 'r') as fptr:
@@ -33,20 +148,267 @@ class CalibrationDoc():
 
         self.calibration_values = sum
 
+    def warn_cache_unused(self, engine):
+        if self.cache_size:
+            print(f'Warning: --cache-size has no effect with the {engine} engine')
+
+    def build_matcher(self, engine):
+        matcher = DigitScanner()
+        if engine == 'mmap':
+            self.warn_cache_unused(engine)
+        elif self.cache_size:
+            matcher = CachedMatcher(matcher, self.cache_size)
+        return matcher
+
+    def extract_values_with_matcher(self, filename, debug, matcher):
+        try:
+            with open(filename, 'r') as fptr:
+                self.extract_values_from_stream(fptr, debug, matcher)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+    def extract_values_from_stream(self, fptr, debug, matcher):
+        sum = 0
+        for line_no, value in self.iter_values(fptr, matcher, debug):
+            sum += value
+        if debug and isinstance(matcher, CachedMatcher):
+            print(matcher)
+        self.calibration_values = sum
+
+    def line_value(self, line, matcher):
+        tens_digit, ones_digit = matcher.first_and_last(line)
+        if tens_digit < 0:
+            print(f'Error: no digit found in {line.rstrip()}')
+            exit()
+        return tens_digit * 10 + ones_digit
+
+    def iter_values(self, lines, matcher=None, debug=False):
+        # Lazily yields (line_no, value) from any iterable of lines, such as
+        # an open file or sys.stdin.
+        if matcher is None:
+            matcher = self.build_matcher('scan')
+        for line_no, line in enumerate(lines, 1):
+            if debug:
+                print (line, end='')
+            value = self.line_value(line, matcher)
+            if debug:
+                print(f'Value = {value}\n')
+            yield line_no, value
+
+    def follow_values(self, filename, debug, engine='scan', poll_interval=1.0):
+        # Tails a growing file, only reading bytes appended since the last
+        # poll, and prints the running total whenever new lines arrive.
+        matcher = self.build_matcher(engine)
+        sum = 0
+        line_no = 0
+        reported = 0
+        pending = ''
+        try:
+            with open(filename, 'r') as fptr:
+                while True:
+                    data = fptr.readline()
+                    if not data:
+                        if line_no != reported:
+                            self.print_cal_values()
+                            reported = line_no
+                        time.sleep(poll_interval)
+                        continue
+                    pending += data
+                    if not pending.endswith('\n'):
+                        continue
+
+                    line_no += 1
+                    value = self.line_value(pending, matcher)
+                    if debug:
+                        print(f'Line {line_no}: {pending.rstrip()} Value = {value}')
+                    sum += value
+                    self.calibration_values = sum
+                    pending = ''
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        except KeyboardInterrupt:
+            pass
+
+    def extract_values_from_mmap(self, filename, debug, matcher):
+        # Walks the mapped file one line at a time without decoding it, so
+        # only the pages being scanned need to be resident.
+        sum = 0
+        try:
+            with open(filename, 'rb') as fptr:
+                size = os.fstat(fptr.fileno()).st_size
+                if size == 0:
+                    self.calibration_values = 0
+                    return
+                with mmap.mmap(fptr.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    if hasattr(buf, 'madvise'):
+                        buf.madvise(mmap.MADV_SEQUENTIAL)
+                    sum = self.sum_buffer_lines(buf, 0, size, matcher, debug)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        self.calibration_values = sum
+
+    def extract_values_with_numpy(self, filename, debug):
+        # The file is read in newline-aligned chunks of about NUMPY_CHUNK_SIZE
+        # bytes, so neither the data nor the temporaries grow with the file.
+        if np is None:
+            print("Error: the 'numpy' module is required for the numpy engine")
+            sys.exit(0)
+        sum = 0
+        pending = b''
+        try:
+            with open(filename, 'rb') as fptr:
+                while True:
+                    data = fptr.read(NUMPY_CHUNK_SIZE)
+                    buffer = pending + data
+                    stop = buffer.rfind(b'\n') + 1 if data else len(buffer)
+                    if stop:
+                        chunk = np.frombuffer(buffer, dtype=np.uint8, count=stop)
+                        newlines = np.flatnonzero(chunk == ord('\n'))
+                        sum += self.sum_numpy_chunk(chunk, newlines, debug)
+                    pending = buffer[stop:]
+                    if not data:
+                        break
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        self.calibration_values = sum
+
+    def sum_numpy_chunk(self, chunk, newlines, debug):
+        # Only the digit positions are materialised; each line's first and
+        # last digit are found by binary search on its start and stop.
+        line_starts = np.concatenate(([0], newlines + 1))
+        line_starts = line_starts[line_starts < len(chunk)]
+        line_stops = np.concatenate((newlines, [len(chunk)]))[:len(line_starts)]
+        digits = np.flatnonzero((chunk >= ord('0')) & (chunk <= ord('9')))
+        first = np.searchsorted(digits, line_starts)
+        last = np.searchsorted(digits, line_stops) - 1
+        missing = np.flatnonzero(first > last)
+        if len(missing):
+            line_start = line_starts[missing[0]]
+            line_stop = line_stops[missing[0]]
+            print(f'Error: no digit found in {chunk[line_start:line_stop].tobytes().decode()}')
+            exit()
+
+        values = ((chunk[digits[first]].astype(np.int64) - ord('0')) * 10 +
+                  (chunk[digits[last]].astype(np.int64) - ord('0')))
+        if debug:
+            print(f'Chunk of {len(line_starts)} lines, Value = {int(values.sum())}\n')
+        return int(values.sum())
+
+    def sum_buffer_lines(self, buf, start, stop, matcher, debug):
+        # Blocks of whole lines are summed by the matcher in C.  A block with
+        # a line lacking a digit is walked line by line, which reports that
+        # line, as is everything when debug output is wanted.
+        if debug:
+            return self.sum_buffer_each_line(buf, start, stop, matcher, debug)
+        sum = 0
+        while start < stop:
+            end = buf.find(b'\n', min(start + MMAP_BLOCK_SIZE, stop), stop)
+            end = stop if end < 0 else end + 1
+            block = buf[start:end]
+            block_sum, lines = matcher.sum_block(block)
+            if lines != block.count(b'\n') + (not block.endswith(b'\n')):
+                block_sum = self.sum_buffer_each_line(buf, start, end, matcher, debug)
+            sum += block_sum
+            start = end
+        return sum
+
+    def sum_buffer_each_line(self, buf, start, stop, matcher, debug):
+        sum = 0
+        while start < stop:
+            end = buf.find(b'\n', start, stop)
+            if end < 0:
+                end = stop
+            if debug:
+                print(buf[start:end].decode())
+            tens_digit, ones_digit = matcher.first_and_last_in_buffer(buf, start, end)
+            if tens_digit < 0:
+                print(f'Error: no digit found in {buf[start:end].decode().rstrip()}')
+                exit()
+
+            value = tens_digit * 10 + ones_digit
+            if debug:
+                print(f'Value = {value}\n')
+            sum += value
+            start = end + 1
+        return sum
+
+    def extract_values_in_parallel(self, filename, workers):
+        # Shards are byte ranges that always end just past a newline, so no
+        # line is split between two workers.
+        self.warn_cache_unused('parallel mmap')
+        try:
+            with open(filename, 'rb') as fptr:
+                size = os.fstat(fptr.fileno()).st_size
+                if size == 0:
+                    self.calibration_values = 0
+                    return
+                with mmap.mmap(fptr.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    bounds = [0]
+                    for shard in range(1, workers):
+                        pos = max(size * shard // workers, bounds[-1])
+                        end = buf.find(b'\n', pos)
+                        bounds.append(size if end < 0 else end + 1)
+                    bounds.append(size)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        shards = [(start, stop) for start, stop in zip(bounds, bounds[1:])
+                  if start < stop]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sums = pool.map(sum_calibration_shard,
+                            [filename] * len(shards),
+                            [start for start, stop in shards],
+                            [stop for start, stop in shards])
+            self.calibration_values = sum(sums)
+
     def print_cal_values(self):
         print (f'Calibration Value = {self.calibration_values}')
 
 
+def sum_calibration_shard(filename, start, stop):
+    cal_doc = CalibrationDoc()
+    matcher = cal_doc.build_matcher('mmap')
+    with open(filename, 'rb') as fptr:
+        with mmap.mmap(fptr.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return cal_doc.sum_buffer_lines(buf, start, stop, matcher, False)
+
+
 def parse_commandline():
     # Instantiate the parser
     parser = argparse.ArgumentParser(description='Optional app description')
 
     parser.add_argument('-v', '--values', type=str,
-                        help='Filename for the calibration values')
+                        help='Filename for the calibration values, - for stdin')
 
     parser.add_argument('-d', '--debug', 
                         action="store_true",
                         help='Turn on verbosity')
+
+    parser.add_argument('-e', '--engine', type=str, default='regex',
+                        choices=['regex', 'scan', 'mmap', 'numpy'],
+                        help='Digit matching engine')
+
+    parser.add_argument('-c', '--cache-size', type=int, default=0,
+                        help='Cache this many distinct lines (scan engine, stdin and --follow)')
+
+    parser.add_argument('-f', '--follow',
+                        action="store_true",
+                        help='Keep reading lines appended to the file')
+
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Sum the file in this many processes (uses the mmap engine)')
     
     return parser.parse_args()
 
@@ -54,7 +416,17 @@ def parse_commandline():
 def main():
     cal_doc = CalibrationDoc()
     args = parse_commandline()
-    cal_doc.extract_values_from_doc(args.values, args.debug)
+    if args.cache_size < 0:
+        print('Error: --cache-size must not be negative')
+        sys.exit(0)
+    cal_doc.cache_size = args.cache_size
+    if args.follow:
+        cal_doc.follow_values(args.values, args.debug, args.engine)
+        return
+    if args.workers > 1:
+        cal_doc.extract_values_in_parallel(args.values, args.workers)
+    else:
+        cal_doc.extract_values_from_doc(args.values, args.debug, args.engine)
     cal_doc.print_cal_values()
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+import sys
+import random
+import time
+import argparse
+
+from day02_part1 import GameLog
+
+
+def naive_query(game_log, limits):
+    results = []
+    for red_limit, green_limit, blue_limit in limits:
+        sum = 0
+        count = 0
+        for game in game_log._games:
+            if game.is_possible(red_limit, green_limit, blue_limit):
+                sum += game.id
+                count += 1
+        results.append((sum, count))
+    return results
+
+
+def benchmark_limit_queries(game_log, query_count, seed):
+    generator = random.Random(seed)
+    limits = [(generator.randint(0, 25), generator.randint(0, 25), generator.randint(0, 25))
+              for _ in range(query_count)]
+
+    start = time.perf_counter()
+    expected = naive_query(game_log, limits)
+    naive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = game_log.query_limits(limits)
+    batch_time = time.perf_counter() - start
+
+    if results != expected:
+        print('Error: batch query results differ from the naive loop')
+        sys.exit(0)
+
+    print(f'{len(game_log._games)} games, {query_count} limit triples')
+    print(f'  naive loop : {naive_time:.3f}s')
+    print(f'  batch index: {batch_time:.3f}s ({naive_time / batch_time:.1f}x)')
+
+
+def parse_commandline():
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(description='Time day02 query engines against the naive loop')
+
+    parser.add_argument('-p', '--puzzle', type=str,
+                        help='Filename for the puzzle')
+
+    parser.add_argument('-q', '--queries', type=int, default=1000,
+                        help='Number of random limit triples')
+
+    parser.add_argument('--seed', type=int, default=2023,
+                        help='Seed for the random limits')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_commandline()
+    game_log = GameLog()
+    game_log.read_game_log(args.puzzle, False, keep_draws=False)
+    benchmark_limit_queries(game_log, args.queries, args.seed)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
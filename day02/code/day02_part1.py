@@ -1,12 +1,48 @@
 import sys
+import os
+import mmap
+import struct
+import hashlib
 import re
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from bisect import bisect_left, bisect_right
 
-class CubeDraw():
+SNAPSHOT_MAGIC = b'AOCD02GS'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<8sII32sQ')
+TOKEN_PATTERN = re.compile(r'Game\s+(\d+)|(\d+)\s+([A-Za-z]+)|(;)')
+
+
+class GameTokenizer():
+    # Counts colours other than red, green and blue so they are reported
+    # rather than silently dropped.
     def __init__(self):
-        self.blue = 0
-        self.red = 0
-        self.green = 0
+        self.unknown_colors = {}
+
+    def count_unknown_color(self, name, count=1):
+        self.unknown_colors[name] = self.unknown_colors.get(name, 0) + count
+
+    def merge_unknown_colors(self, unknown_colors):
+        for name, count in unknown_colors.items():
+            self.count_unknown_color(name, count)
+
+    def print_tokens(self, line):
+        draw_index = 0
+        for game, count, color, separator in TOKEN_PATTERN.findall(line):
+            if count:
+                print(f'  draw {draw_index}: {count} {color}')
+            elif separator:
+                draw_index += 1
+            else:
+                print(f'  Game {game}')
+
+class CubeDraw():
+    def __init__(self, red=0, green=0, blue=0):
+        self._blue = blue
+        self._red = red
+        self._green = green
 
     @property 
     def red(self):
@@ -33,9 +69,16 @@ class CubeDraw():
         self._green = green
 
 class Game():
-    def __init__(self, id):
+    # The per-colour maxima are kept up to date as draws arrive, so the
+    # feasibility and power checks never rescan the draws and the draws
+    # themselves can be discarded with keep_draws=False.
+    def __init__(self, id, keep_draws=True):
         self.id = id
         self._draws = []
+        self._keep_draws = keep_draws
+        self._max_red = 0
+        self._max_green = 0
+        self._max_blue = 0
 
     @property 
     def id(self):
@@ -45,63 +88,353 @@ class Game():
     def id(self, id):
         self._id = id
         
+    @property 
+    def max_red(self):
+        return self._max_red
+
+    @property 
+    def max_green(self):
+        return self._max_green
+
+    @property 
+    def max_blue(self):
+        return self._max_blue
+
+    def update_maxima(self, red, green, blue):
+        if red > self._max_red:
+            self._max_red = red
+        if green > self._max_green:
+            self._max_green = green
+        if blue > self._max_blue:
+            self._max_blue = blue
+
     def add_draw(self, draw):
+        self.update_maxima(draw.red, draw.green, draw.blue)
         self._draws.append(draw)
 
+    def add_counts(self, red, green, blue):
+        self.update_maxima(red, green, blue)
+        if self._keep_draws:
+            self._draws.append(CubeDraw(red, green, blue))
+
     def is_possible(self, red_limit, green_limit, blue_limit):
-        possible = 1
-        for draw in self._draws:
-            if ((draw.red > red_limit) or
-               (draw.green > green_limit) or
-               (draw.blue > blue_limit)):
-                    possible = 0
-                    break
-        return possible
+        if ((self._max_red > red_limit) or
+           (self._max_green > green_limit) or
+           (self._max_blue > blue_limit)):
+            return 0
+        return 1
+
+class GameMaxima():
+    # Per-game id and cube maxima as parallel columns of unsigned ints:
+    # array('I') when built at ingest, or memoryviews straight over a
+    # mapped snapshot, so loading a snapshot creates no Game objects.
+    def __init__(self, ids=None, red=None, green=None, blue=None):
+        self.ids = array('I') if ids is None else ids
+        self.red = array('I') if red is None else red
+        self.green = array('I') if green is None else green
+        self.blue = array('I') if blue is None else blue
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, id, red, green, blue):
+        self.ids.append(id)
+        self.red.append(red)
+        self.green.append(green)
+        self.blue.append(blue)
+
+    def rows(self):
+        return zip(self.ids, self.red, self.green, self.blue)
+
+class LimitIndex():
+    # Answers many (red, green, blue) limit queries against the per-game
+    # maxima at once.  Queries are swept in increasing red limit while the
+    # games that fit are inserted into 2D Fenwick trees over the compressed
+    # green and blue maxima, so each query is an O(log G * log B) prefix sum.
+    def __init__(self, rows):
+        self._games = sorted((red, green, blue, id) for id, red, green, blue in rows)
+        self._greens = sorted(set(game[1] for game in self._games))
+        self._blues = sorted(set(game[2] for game in self._games))
+
+    def add(self, tree, green_index, blue_index, value):
+        while green_index < len(tree):
+            row = tree[green_index]
+            column = blue_index
+            while column < len(row):
+                row[column] += value
+                column += column & -column
+            green_index += green_index & -green_index
+
+    def prefix(self, tree, green_index, blue_index):
+        total = 0
+        while green_index > 0:
+            row = tree[green_index]
+            column = blue_index
+            while column > 0:
+                total += row[column]
+                column -= column & -column
+            green_index -= green_index & -green_index
+        return total
+
+    def query(self, limits):
+        rows = len(self._greens) + 1
+        columns = len(self._blues) + 1
+        id_tree = [[0] * columns for _ in range(rows)]
+        count_tree = [[0] * columns for _ in range(rows)]
+        results = [None] * len(limits)
+        next_game = 0
+        for query in sorted(range(len(limits)), key=lambda query: limits[query][0]):
+            red_limit, green_limit, blue_limit = limits[query]
+            while (next_game < len(self._games) and
+                   self._games[next_game][0] <= red_limit):
+                red, green, blue, id = self._games[next_game]
+                green_index = bisect_left(self._greens, green) + 1
+                blue_index = bisect_left(self._blues, blue) + 1
+                self.add(id_tree, green_index, blue_index, id)
+                self.add(count_tree, green_index, blue_index, 1)
+                next_game += 1
+
+            green_index = bisect_right(self._greens, green_limit)
+            blue_index = bisect_right(self._blues, blue_limit)
+            results[query] = (self.prefix(id_tree, green_index, blue_index),
+                              self.prefix(count_tree, green_index, blue_index))
+        return results
 
 class GameLog():   
     def __init__(self):
         self._games = []
+        self._maxima = None
+        self._snapshot_map = None
+        self._tokenizer = GameTokenizer()
 
-    def read_game_log(self, filename, debug):
+    def read_game_log(self, filename, debug, keep_draws=True):
         try:
             with open(filename, 'r') as fptr:
                 for line in fptr:
-                    if debug:
-                        print (line, end='')
-                    game_id, results = line.split(':')
-                    match = re.search(r'^Game\s+(\d+)', game_id)
-                    if match:
-                       game = Game(int(match.group(1)))
-                       self._games.append(game)
-
-                    for draw_data in results.split(';'):
-                        draw = CubeDraw()
-                        game.add_draw(draw)
-                        match = re.search(r'(\d+)\s+red', draw_data)
-                        if match:
-                            draw.red = int(match.group(1))
-
-                        match = re.search(r'(\d+)\s+blue', draw_data)
-                        if match:
-                            draw.blue = int(match.group(1))
-
-                        match = re.search(r'(\d+)\s+green', draw_data)
-                        if match:
-                            draw.green = int(match.group(1))
+                    game = self.parse_game_line(line, debug, keep_draws)
+                    if game is not None:
+                        self._games.append(game)
 
 
         except IOError:
             print(f"Error: Could not open \'{filename}\'")
             sys.exit(0)
 
+    def parse_game_line(self, line, debug, keep_draws=True):
+        # The "Game N" token opens the game, counts fill the current draw
+        # and each ";" closes it, so a game with no cubes is still kept.
+        if debug:
+            print (line, end='')
+            self._tokenizer.print_tokens(line)
+        game = None
+        red = green = blue = 0
+        for game_id, count, color, separator in TOKEN_PATTERN.findall(line):
+            if count:
+                if color == 'red':
+                    red = int(count)
+                elif color == 'green':
+                    green = int(count)
+                elif color == 'blue':
+                    blue = int(count)
+                else:
+                    self._tokenizer.count_unknown_color(color)
+            elif separator:
+                if game is not None:
+                    game.add_counts(red, green, blue)
+                red = green = blue = 0
+            elif game is None:
+                game = Game(int(game_id), keep_draws)
+        if game is not None:
+            game.add_counts(red, green, blue)
+        return game
+
+    def content_hash(self, filename):
+        digest = hashlib.sha256()
+        try:
+            with open(filename, 'rb') as fptr:
+                for chunk in iter(lambda: fptr.read(1 << 20), b''):
+                    digest.update(chunk)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        return digest.digest()
+
+    def load_snapshot(self, filename, debug):
+        # The snapshot sits next to the puzzle and holds the id, max red,
+        # max green and max blue columns, little-endian, one after another.
+        # It is only trusted when its format version and the hash of the
+        # puzzle contents still match.
+        digest = self.content_hash(filename)
+        snapshot = filename + '.snapshot'
+        if self.read_snapshot(snapshot, digest):
+            if debug:
+                print(f'Loaded {len(self._maxima)} games from {snapshot}')
+            return
+        if debug:
+            print(f'Snapshot {snapshot} is missing or stale, rebuilding it')
+        self.read_game_log(filename, debug, keep_draws=False)
+        self.write_snapshot(snapshot, digest)
+
+    def read_snapshot(self, snapshot, digest):
+        try:
+            with open(snapshot, 'rb') as fptr:
+                size = os.fstat(fptr.fileno()).st_size
+                if size < SNAPSHOT_HEADER.size:
+                    return False
+                buf = mmap.mmap(fptr.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, version, itemsize, snapshot_digest, count = \
+                    SNAPSHOT_HEADER.unpack_from(buf)
+                if (magic != SNAPSHOT_MAGIC or
+                    version != SNAPSHOT_VERSION or
+                    itemsize != array('I').itemsize or
+                    snapshot_digest != digest or
+                    size != SNAPSHOT_HEADER.size + count * 4 * itemsize):
+                    buf.close()
+                    return False
+
+        except IOError:
+            return False
+
+        # The columns stay views into the map, which is kept open for them
+        self._snapshot_map = buf
+        view = memoryview(buf)
+        columns = []
+        for column in range(4):
+            start = SNAPSHOT_HEADER.size + column * count * itemsize
+            data = view[start:start + count * itemsize]
+            if sys.byteorder == 'little':
+                columns.append(data.cast('I'))
+            else:
+                values = array('I')
+                values.frombytes(data)
+                values.byteswap()
+                columns.append(values)
+        self._maxima = GameMaxima(*columns)
+        return True
+
+    def write_snapshot(self, snapshot, digest):
+        maxima = GameMaxima()
+        for row in self.game_rows():
+            maxima.add(*row)
+        try:
+            with open(snapshot + '.tmp', 'wb') as fptr:
+                fptr.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                                maxima.ids.itemsize, digest,
+                                                len(maxima)))
+                for column in (maxima.ids, maxima.red, maxima.green, maxima.blue):
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    fptr.write(column.tobytes())
+            os.replace(snapshot + '.tmp', snapshot)
+
+        except IOError:
+            print(f"Warning: Could not write snapshot \'{snapshot}\'")
+
+    def game_rows(self):
+        # (id, max red, max green, max blue) per game, from the snapshot
+        # columns when loaded from one and from the Game objects otherwise
+        if self._maxima is not None:
+            return self._maxima.rows()
+        return ((game.id, game.max_red, game.max_green, game.max_blue)
+                for game in self._games)
+
+    def report_unknown_colors(self):
+        for name, count in self._tokenizer.unknown_colors.items():
+            print(f'Warning: unknown color "{name}" seen {count} time(s)')
+
+    def shard_boundaries(self, filename, workers):
+        # Byte offsets that each fall just past a newline, so every shard
+        # holds whole lines.
+        try:
+            with open(filename, 'rb') as fptr:
+                size = os.fstat(fptr.fileno()).st_size
+                bounds = [0]
+                for shard in range(1, workers):
+                    pos = max(size * shard // workers, bounds[-1])
+                    fptr.seek(pos)
+                    fptr.readline()
+                    bounds.append(min(fptr.tell(), size))
+                bounds.append(size)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        return [(start, stop) for start, stop in zip(bounds, bounds[1:])
+                if start < stop]
+
+    def analyze_in_parallel(self, filename, workers, red_limit, green_limit, blue_limit):
+        shards = self.shard_boundaries(filename, workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(reduce_game_shard, filename, start, stop,
+                                   red_limit, green_limit, blue_limit)
+                       for start, stop in shards]
+            totals = [future.result() for future in futures]
+        for _, unknown_colors in totals:
+            self._tokenizer.merge_unknown_colors(unknown_colors)
+        return sum(total[0] for total in totals)
+
     def analyze_game_log(self, red_limit, green_limit, blue_limit):
         sum = 0
+        if self._maxima is not None:
+            for id, red, green, blue in self._maxima.rows():
+                if red <= red_limit and green <= green_limit and blue <= blue_limit:
+                    sum += id
+            return sum
         for game in self._games:
             if game.is_possible(red_limit, green_limit, blue_limit):
                 sum += game.id
         return sum
+
+    def query_limits(self, limits):
+        # Returns (sum of feasible ids, count of feasible games) per triple
+        return LimitIndex(self.game_rows()).query(limits)
+
+    def read_limits(self, filename):
+        limits = []
+        try:
+            with open(filename, 'r') as fptr:
+                for line in fptr:
+                    fields = line.split()
+                    if not fields:
+                        continue
+                    if (len(fields) != 3 or
+                        not all(field.isdigit() for field in fields)):
+                        print(f'Error: bad limits {line.rstrip()} in {filename}, expected "red green blue"')
+                        sys.exit(0)
+                    limits.append(tuple(int(limit) for limit in fields))
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        return limits
      
 
+def read_shard_games(game_log, filename, start, stop):
+    with open(filename, 'rb') as fptr:
+        fptr.seek(start)
+        pos = start
+        while pos < stop:
+            line = fptr.readline()
+            if not line:
+                break
+            pos += len(line)
+            game = game_log.parse_game_line(line.decode(), False, keep_draws=False)
+            if game is not None:
+                yield game
+
+
+def reduce_game_shard(filename, start, stop, red_limit, green_limit, blue_limit):
+    # Runs in a worker process and only returns the shard's id sum and
+    # unknown color counts
+    game_log = GameLog()
+    sum = 0
+    for game in read_shard_games(game_log, filename, start, stop):
+        if game.is_possible(red_limit, green_limit, blue_limit):
+            sum += game.id
+    return sum, game_log._tokenizer.unknown_colors
+
+
 def parse_commandline():
     # Instantiate the parser
     parser = argparse.ArgumentParser(description='Optional app description')
@@ -112,6 +445,20 @@ def parse_commandline():
     parser.add_argument('-d', '--debug', 
                         action="store_true",
                         help='Turn on verbosity')
+
+    parser.add_argument('--discard-draws',
+                        action="store_true",
+                        help='Only keep the per-game cube maxima')
+
+    parser.add_argument('--snapshot',
+                        action="store_true",
+                        help='Load per-game maxima from a binary snapshot next to the puzzle')
+
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Parse and reduce the puzzle in this many processes')
+
+    parser.add_argument('-l', '--limits', type=str,
+                        help='File of "red green blue" limit triples to query in one batch')
     
     return parser.parse_args()
 
@@ -119,7 +466,27 @@ def parse_commandline():
 def main():
     game_log = GameLog()
     args = parse_commandline()
-    game_log.read_game_log(args.puzzle, args.debug)
+    if args.workers > 1:
+        unused = [flag for flag, given in (('--snapshot', args.snapshot),
+                                           ('--limits', args.limits),
+                                           ('--debug', args.debug)) if given]
+        if unused:
+            print(f'Error: {", ".join(unused)} cannot be combined with --workers')
+            sys.exit(0)
+        sum = game_log.analyze_in_parallel(args.puzzle, args.workers, 12, 13, 14)
+        game_log.report_unknown_colors()
+        print(f'Sum of possible games IDs is: {sum}')
+        return
+    if args.snapshot:
+        game_log.load_snapshot(args.puzzle, args.debug)
+    else:
+        game_log.read_game_log(args.puzzle, args.debug, not args.discard_draws)
+    game_log.report_unknown_colors()
+    if args.limits:
+        limits = game_log.read_limits(args.limits)
+        for limit, (sum, count) in zip(limits, game_log.query_limits(limits)):
+            print(f'Limits {limit}: sum of possible game IDs {sum}, {count} game(s)')
+        return
     sum = game_log.analyze_game_log(12, 13, 14)
     print(f'Sum of possible games IDs is: {sum}')
 
@@ -1,12 +1,53 @@
 import sys
+import os
+import mmap
+import heapq
+import struct
+import hashlib
 import re
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-class CubeDraw():
+SNAPSHOT_MAGIC = b'AOCD02GS'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<8sII32sQ')
+TOKEN_PATTERN = re.compile(r'Game\s+(\d+)|(\d+)\s+([A-Za-z]+)|(;)')
+
+
+class GameTokenizer():
+    # Counts colours other than red, green and blue so they are reported
+    # rather than silently dropped.
     def __init__(self):
-        self.blue = 0
-        self.red = 0
-        self.green = 0
+        self.unknown_colors = {}
+
+    def count_unknown_color(self, name, count=1):
+        self.unknown_colors[name] = self.unknown_colors.get(name, 0) + count
+
+    def merge_unknown_colors(self, unknown_colors):
+        for name, count in unknown_colors.items():
+            self.count_unknown_color(name, count)
+
+    def print_tokens(self, line):
+        draw_index = 0
+        for game, count, color, separator in TOKEN_PATTERN.findall(line):
+            if count:
+                print(f'  draw {draw_index}: {count} {color}')
+            elif separator:
+                draw_index += 1
+            else:
+                print(f'  Game {game}')
+
+class CubeDraw():
+    def __init__(self, red=0, green=0, blue=0):
+        self._blue = blue
+        self._red = red
+        self._green = green
 
     @property 
     def red(self):
@@ -33,10 +74,40 @@ class CubeDraw():
         self._green = green
 
 
+class DrawColumns():
+    # Struct-of-arrays draw storage: one row per draw in the red, green and
+    # blue columns, plus the id and first row of every game.
+    def __init__(self):
+        self.red = array('I')
+        self.green = array('I')
+        self.blue = array('I')
+        self.game_ids = array('I')
+        self.offsets = array('I')
+
+    def __len__(self):
+        return len(self.red)
+
+    def add_game(self, id):
+        self.game_ids.append(id)
+        self.offsets.append(len(self.red))
+
+    def add_draw(self, red, green, blue):
+        self.red.append(red)
+        self.green.append(green)
+        self.blue.append(blue)
+
+
 class Game():
-    def __init__(self, id):
+    # The per-colour maxima are kept up to date as draws arrive, so the
+    # feasibility and power checks never rescan the draws and the draws
+    # themselves can be discarded with keep_draws=False.
+    def __init__(self, id, keep_draws=True):
         self.id = id
         self._draws = []
+        self._keep_draws = keep_draws
+        self._max_red = 0
+        self._max_green = 0
+        self._max_blue = 0
 
     @property 
     def power(self):
@@ -54,76 +125,504 @@ class Game():
     def id(self, id):
         self._id = id
         
+    @property 
+    def max_red(self):
+        return self._max_red
+
+    @property 
+    def max_green(self):
+        return self._max_green
+
+    @property 
+    def max_blue(self):
+        return self._max_blue
+
+    def update_maxima(self, red, green, blue):
+        if red > self._max_red:
+            self._max_red = red
+        if green > self._max_green:
+            self._max_green = green
+        if blue > self._max_blue:
+            self._max_blue = blue
+
     def add_draw(self, draw):
+        self.update_maxima(draw.red, draw.green, draw.blue)
         self._draws.append(draw)
 
+    def add_counts(self, red, green, blue):
+        self.update_maxima(red, green, blue)
+        if self._keep_draws:
+            self._draws.append(CubeDraw(red, green, blue))
+
     def analyze(self):
-        max_red = 0
-        max_blue = 0
-        max_green = 0
-        for draw in self._draws:
-            max_red = max(max_red, draw.red)
-            max_blue = max(max_blue, draw.blue)
-            max_green = max(max_green, draw.green)
-        
-        self.power = max_red * max_blue * max_green
+        self.power = self._max_red * self._max_blue * self._max_green
  
     def is_possible(self, red_limit, green_limit, blue_limit):
-        possible = 1
-        for draw in self._draws:
-            if ((draw.red > red_limit) or
-               (draw.green > green_limit) or
-               (draw.blue > blue_limit)):
-                    possible = 0
-                    break
-        return possible
+        if ((self._max_red > red_limit) or
+           (self._max_green > green_limit) or
+           (self._max_blue > blue_limit)):
+            return 0
+        return 1
+
+
+class GameMaxima():
+    # Per-game id and cube maxima as parallel columns of unsigned ints:
+    # array('I') when built at ingest, or memoryviews straight over a
+    # mapped snapshot, so loading a snapshot creates no Game objects.
+    def __init__(self, ids=None, red=None, green=None, blue=None):
+        self.ids = array('I') if ids is None else ids
+        self.red = array('I') if red is None else red
+        self.green = array('I') if green is None else green
+        self.blue = array('I') if blue is None else blue
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, id, red, green, blue):
+        self.ids.append(id)
+        self.red.append(red)
+        self.green.append(green)
+        self.blue.append(blue)
+
+    def rows(self):
+        return zip(self.ids, self.red, self.green, self.blue)
+
+
+class P2Quantile():
+    # Streaming quantile estimate using the P-square algorithm of Jain and
+    # Chlamtac: five markers are nudged towards their ideal positions as
+    # values arrive, so memory stays constant however many values are seen.
+    def __init__(self, p):
+        self.p = p
+        self._heights = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        heights = self._heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+
+        positions = self._positions
+        for marker in range(cell + 1, 5):
+            positions[marker] += 1
+        for marker in range(5):
+            self._desired[marker] += self._increments[marker]
+
+        for marker in range(1, 4):
+            offset = self._desired[marker] - positions[marker]
+            if ((offset >= 1 and positions[marker + 1] - positions[marker] > 1) or
+                (offset <= -1 and positions[marker - 1] - positions[marker] < -1)):
+                step = 1 if offset > 0 else -1
+                height = self.parabolic(marker, step)
+                if not heights[marker - 1] < height < heights[marker + 1]:
+                    height = (heights[marker] + step *
+                              (heights[marker + step] - heights[marker]) /
+                              (positions[marker + step] - positions[marker]))
+                heights[marker] = height
+                positions[marker] += step
+
+    def parabolic(self, marker, step):
+        heights = self._heights
+        positions = self._positions
+        return heights[marker] + step / (positions[marker + 1] - positions[marker - 1]) * (
+            (positions[marker] - positions[marker - 1] + step) *
+            (heights[marker + 1] - heights[marker]) /
+            (positions[marker + 1] - positions[marker]) +
+            (positions[marker + 1] - positions[marker] - step) *
+            (heights[marker] - heights[marker - 1]) /
+            (positions[marker] - positions[marker - 1]))
+
+    @property 
+    def value(self):
+        heights = self._heights
+        if not heights:
+            return 0
+        if len(heights) < 5:
+            return heights[min(len(heights) - 1, int(self.p * len(heights)))]
+        return heights[2]
+
+
+class GameStats():
+    # Single-pass statistics over game powers: a bounded min-heap holds the
+    # top_k most powerful games and P2Quantile sketches track percentiles.
+    def __init__(self, top_k=5, percentiles=(50, 90, 99)):
+        self._top_k = top_k
+        self._top = []
+        self._quantiles = [P2Quantile(percentile / 100) for percentile in percentiles]
+        self.max_red = 0
+        self.max_green = 0
+        self.max_blue = 0
+
+    def add(self, game):
+        self.add_row(game.id, game.power, game.max_red, game.max_green, game.max_blue)
+
+    def add_row(self, id, power, red, green, blue):
+        entry = (power, id)
+        if len(self._top) < self._top_k:
+            heapq.heappush(self._top, entry)
+        elif self._top and entry > self._top[0]:
+            heapq.heapreplace(self._top, entry)
+        for quantile in self._quantiles:
+            quantile.add(power)
+        self.max_red = max(self.max_red, red)
+        self.max_green = max(self.max_green, green)
+        self.max_blue = max(self.max_blue, blue)
+
+    @property 
+    def top_games(self):
+        return sorted(self._top, reverse=True)
+
+    def print_stats(self):
+        top = ', '.join(f'Game {id} ({power})' for power, id in self.top_games)
+        print(f'Top {self._top_k} games by power: {top}')
+        percentiles = ' '.join(f'p{round(quantile.p * 100)}={quantile.value:.0f}'
+                               for quantile in self._quantiles)
+        print(f'Power percentiles: {percentiles}')
+        print(f'Most cubes in a game: red={self.max_red} green={self.max_green} blue={self.max_blue}')
 
 
 class GameLog():   
     def __init__(self):
         self._games = []
+        self._maxima = None
+        self._snapshot_map = None
+        self._columns = DrawColumns()
+        self._tokenizer = GameTokenizer()
+        self.stats = None
         self.sum = 0
 
-    def read_game_log(self, filename, debug):
+    def read_game_log(self, filename, debug, storage='objects', keep_draws=True):
         try:
             with open(filename, 'r') as fptr:
+                if storage == 'columnar':
+                    self._maxima = GameMaxima()
+                    for line in fptr:
+                        self.parse_columnar_line(line, debug, keep_draws)
+                    return
                 for line in fptr:
-                    if debug:
-                        print (line, end='')
-                    game_id, results = line.split(':')
-                    match = re.search(r'^Game\s+(\d+)', game_id)
-                    if match:
-                       game = Game(int(match.group(1)))
-                       self._games.append(game)
-
-                    for draw_data in results.split(';'):
-                        draw = CubeDraw()
-                        game.add_draw(draw)
-                        match = re.search(r'(\d+)\s+red', draw_data)
-                        if match:
-                            draw.red = int(match.group(1))
-
-                        match = re.search(r'(\d+)\s+blue', draw_data)
-                        if match:
-                            draw.blue = int(match.group(1))
-
-                        match = re.search(r'(\d+)\s+green', draw_data)
-                        if match:
-                            draw.green = int(match.group(1))
+                    game = self.parse_game_line(line, debug, keep_draws)
+                    if game is not None:
+                        self._games.append(game)
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+    def parse_game_line(self, line, debug, keep_draws=True):
+        # The "Game N" token opens the game, counts fill the current draw
+        # and each ";" closes it, so a game with no cubes is still kept.
+        if debug:
+            print (line, end='')
+            self._tokenizer.print_tokens(line)
+        game = None
+        red = green = blue = 0
+        for game_id, count, color, separator in TOKEN_PATTERN.findall(line):
+            if count:
+                if color == 'red':
+                    red = int(count)
+                elif color == 'green':
+                    green = int(count)
+                elif color == 'blue':
+                    blue = int(count)
+                else:
+                    self._tokenizer.count_unknown_color(color)
+            elif separator:
+                if game is not None:
+                    game.add_counts(red, green, blue)
+                red = green = blue = 0
+            elif game is None:
+                game = Game(int(game_id), keep_draws)
+        if game is not None:
+            game.add_counts(red, green, blue)
+        return game
+
+    def parse_columnar_line(self, line, debug, keep_draws=True):
+        # Same grammar as parse_game_line, but the game's maxima go straight
+        # into the maxima columns and its draws into the draw columns, so no
+        # per-game object is built.
+        if debug:
+            print (line, end='')
+            self._tokenizer.print_tokens(line)
+        id = None
+        red = green = blue = 0
+        max_red = max_green = max_blue = 0
+        for game_id, count, color, separator in TOKEN_PATTERN.findall(line):
+            if count:
+                if color == 'red':
+                    red = int(count)
+                elif color == 'green':
+                    green = int(count)
+                elif color == 'blue':
+                    blue = int(count)
+                else:
+                    self._tokenizer.count_unknown_color(color)
+            elif separator:
+                if id is not None:
+                    max_red = max(max_red, red)
+                    max_green = max(max_green, green)
+                    max_blue = max(max_blue, blue)
+                    if keep_draws:
+                        self._columns.add_draw(red, green, blue)
+                red = green = blue = 0
+            elif id is None:
+                id = int(game_id)
+                if keep_draws:
+                    self._columns.add_game(id)
+        if id is None:
+            return False
+        if keep_draws:
+            self._columns.add_draw(red, green, blue)
+        self._maxima.add(id, max(max_red, red), max(max_green, green), max(max_blue, blue))
+        return True
+
+    def content_hash(self, filename):
+        digest = hashlib.sha256()
+        try:
+            with open(filename, 'rb') as fptr:
+                for chunk in iter(lambda: fptr.read(1 << 20), b''):
+                    digest.update(chunk)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        return digest.digest()
+
+    def load_snapshot(self, filename, debug):
+        # The snapshot sits next to the puzzle and holds the id, max red,
+        # max green and max blue columns, little-endian, one after another.
+        # It is only trusted when its format version and the hash of the
+        # puzzle contents still match.
+        digest = self.content_hash(filename)
+        snapshot = filename + '.snapshot'
+        if self.read_snapshot(snapshot, digest):
+            if debug:
+                print(f'Loaded {len(self._maxima)} games from {snapshot}')
+            return
+        if debug:
+            print(f'Snapshot {snapshot} is missing or stale, rebuilding it')
+        self.read_game_log(filename, debug, 'columnar', keep_draws=False)
+        self.write_snapshot(snapshot, digest)
+
+    def read_snapshot(self, snapshot, digest):
+        try:
+            with open(snapshot, 'rb') as fptr:
+                size = os.fstat(fptr.fileno()).st_size
+                if size < SNAPSHOT_HEADER.size:
+                    return False
+                buf = mmap.mmap(fptr.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, version, itemsize, snapshot_digest, count = \
+                    SNAPSHOT_HEADER.unpack_from(buf)
+                if (magic != SNAPSHOT_MAGIC or
+                    version != SNAPSHOT_VERSION or
+                    itemsize != array('I').itemsize or
+                    snapshot_digest != digest or
+                    size != SNAPSHOT_HEADER.size + count * 4 * itemsize):
+                    buf.close()
+                    return False
+
+        except IOError:
+            return False
+
+        # The columns stay views into the map, which is kept open for them
+        self._snapshot_map = buf
+        view = memoryview(buf)
+        columns = []
+        for column in range(4):
+            start = SNAPSHOT_HEADER.size + column * count * itemsize
+            data = view[start:start + count * itemsize]
+            if sys.byteorder == 'little':
+                columns.append(data.cast('I'))
+            else:
+                values = array('I')
+                values.frombytes(data)
+                values.byteswap()
+                columns.append(values)
+        self._maxima = GameMaxima(*columns)
+        return True
+
+    def write_snapshot(self, snapshot, digest):
+        maxima = GameMaxima()
+        for row in self.game_rows():
+            maxima.add(*row)
+        try:
+            with open(snapshot + '.tmp', 'wb') as fptr:
+                fptr.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                                maxima.ids.itemsize, digest,
+                                                len(maxima)))
+                for column in (maxima.ids, maxima.red, maxima.green, maxima.blue):
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    fptr.write(column.tobytes())
+            os.replace(snapshot + '.tmp', snapshot)
+
+        except IOError:
+            print(f"Warning: Could not write snapshot \'{snapshot}\'")
+
+    def game_rows(self):
+        # (id, max red, max green, max blue) per game, from the snapshot
+        # columns when loaded from one and from the Game objects otherwise
+        if self._maxima is not None:
+            return self._maxima.rows()
+        return ((game.id, game.max_red, game.max_green, game.max_blue)
+                for game in self._games)
+
+    def report_unknown_colors(self):
+        for name, count in self._tokenizer.unknown_colors.items():
+            print(f'Warning: unknown color "{name}" seen {count} time(s)')
+
+    def shard_boundaries(self, filename, workers):
+        # Byte offsets that each fall just past a newline, so every shard
+        # holds whole lines.
+        try:
+            with open(filename, 'rb') as fptr:
+                size = os.fstat(fptr.fileno()).st_size
+                bounds = [0]
+                for shard in range(1, workers):
+                    pos = max(size * shard // workers, bounds[-1])
+                    fptr.seek(pos)
+                    fptr.readline()
+                    bounds.append(min(fptr.tell(), size))
+                bounds.append(size)
+
         except IOError:
             print(f"Error: Could not open \'{filename}\'")
             sys.exit(0)
+        return [(start, stop) for start, stop in zip(bounds, bounds[1:])
+                if start < stop]
+
+    def analyze_in_parallel(self, filename, workers, red_limit, green_limit, blue_limit):
+        shards = self.shard_boundaries(filename, workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(reduce_game_shard, filename, start, stop,
+                                   red_limit, green_limit, blue_limit)
+                       for start, stop in shards]
+            totals = [future.result() for future in futures]
+        for _, _, unknown_colors in totals:
+            self._tokenizer.merge_unknown_colors(unknown_colors)
+        self.sum = sum(total[0] for total in totals)
+        self.power_sum = sum(total[1] for total in totals)
 
     def analyze_game_log(self, red_limit, green_limit, blue_limit):
+        if self._maxima is not None:
+            self.analyze_maxima(red_limit, green_limit, blue_limit)
+            return
         sum = 0
         power_sum = 0
+        stats = self.stats
         for game in self._games:
             game.analyze()
             power_sum += game.power
+            if stats is not None:
+                stats.add(game)
             if game.is_possible(red_limit, green_limit, blue_limit):
                 sum += game.id
         self.sum = sum
         self.power_sum = power_sum
+
+    def analyze_maxima(self, red_limit, green_limit, blue_limit):
+        # The same totals read straight from the maxima columns
+        sum = 0
+        power_sum = 0
+        stats = self.stats
+        for id, red, green, blue in self._maxima.rows():
+            power = red * green * blue
+            power_sum += power
+            if stats is not None:
+                stats.add_row(id, power, red, green, blue)
+            if red <= red_limit and green <= green_limit and blue <= blue_limit:
+                sum += id
+        self.sum = sum
+        self.power_sum = power_sum
+
+    def game_maxima_arrays(self):
+        # Per-game maxima as NumPy columns.  Columnar ingest and snapshots
+        # already hold them as unsigned int columns; otherwise they come
+        # from the maxima the games tracked at ingest.
+        if self._maxima is not None:
+            return tuple(np.frombuffer(column, dtype=np.uint32).astype(np.int64)
+                         for column in (self._maxima.ids, self._maxima.red,
+                                        self._maxima.green, self._maxima.blue))
+        count = len(self._games)
+        ids = np.fromiter((game.id for game in self._games), dtype=np.int64, count=count)
+        red = np.fromiter((game.max_red for game in self._games), dtype=np.int64, count=count)
+        green = np.fromiter((game.max_green for game in self._games), dtype=np.int64, count=count)
+        blue = np.fromiter((game.max_blue for game in self._games), dtype=np.int64, count=count)
+        return ids, red, green, blue
+
+    def analyze_game_log_numpy(self, red_limit, green_limit, blue_limit):
+        if np is None:
+            print("Error: the 'numpy' module is required for the numpy engine")
+            sys.exit(0)
+        ids, red, green, blue = self.game_maxima_arrays()
+        possible = (red <= red_limit) & (green <= green_limit) & (blue <= blue_limit)
+        self.sum = int(ids[possible].sum())
+        self.power_sum = int((red * green * blue).sum())
+
+    def start_stream(self, red_limit, green_limit, blue_limit):
+        # Append-only mode: games are folded into the totals as they are
+        # pushed and then dropped, so memory does not grow with the log.
+        self._limits = (red_limit, green_limit, blue_limit)
+        self.sum = 0
+        self.power_sum = 0
+
+    def push_line(self, line, debug=False):
+        game = self.parse_game_line(line, debug, keep_draws=False)
+        if game is None:
+            return False
+        game.analyze()
+        self.power_sum += game.power
+        if self.stats is not None:
+            self.stats.add(game)
+        if game.is_possible(*self._limits):
+            self.sum += game.id
+        return True
+
+    def stream_game_log(self, fptr, debug, follow=False, poll_interval=1.0):
+        # With follow, waits for lines appended to the file instead of
+        # stopping at the end of it.  Unknown colors are reported once the
+        # stream ends or is interrupted.
+        pending = ''
+        try:
+            while True:
+                data = fptr.readline()
+                if not data:
+                    if not follow:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                pending += data
+                if follow and not pending.endswith('\n'):
+                    continue
+                folded = self.push_line(pending, debug)
+                pending = ''
+                if not folded:
+                    continue
+                self.print_totals()
+                if self.stats is not None:
+                    self.stats.print_stats()
+
+        except KeyboardInterrupt:
+            pass
+        self.report_unknown_colors()
+
+    def print_totals(self):
+        print(f'Sum of possible games IDs is: {self.sum}')
+        print(f'Sum of game powers is: {self.power_sum}')
+
     @property 
     def sum(self):
         return self._sum
@@ -141,16 +640,75 @@ class GameLog():
         self._power_sum = sum
 
 
+def read_shard_games(game_log, filename, start, stop):
+    with open(filename, 'rb') as fptr:
+        fptr.seek(start)
+        pos = start
+        while pos < stop:
+            line = fptr.readline()
+            if not line:
+                break
+            pos += len(line)
+            game = game_log.parse_game_line(line.decode(), False, keep_draws=False)
+            if game is not None:
+                yield game
+
+
+def reduce_game_shard(filename, start, stop, red_limit, green_limit, blue_limit):
+    # Runs in a worker process and only returns the shard's two totals and
+    # unknown color counts
+    game_log = GameLog()
+    sum = 0
+    power_sum = 0
+    for game in read_shard_games(game_log, filename, start, stop):
+        game.analyze()
+        power_sum += game.power
+        if game.is_possible(red_limit, green_limit, blue_limit):
+            sum += game.id
+    return sum, power_sum, game_log._tokenizer.unknown_colors
+
+
 def parse_commandline():
     # Instantiate the parser
     parser = argparse.ArgumentParser(description='Optional app description')
 
     parser.add_argument('-p', '--puzzle', type=str,
-                        help='Filename for the puzzle')
+                        help='Filename for the puzzle, - for stdin')
 
     parser.add_argument('-d', '--debug', 
                         action="store_true",
                         help='Turn on verbosity')
+
+    parser.add_argument('-s', '--storage', type=str,
+                        choices=['objects', 'columnar'],
+                        help='Keep games as objects or as maxima and draws in array columns '
+                             '(default objects, columnar with the numpy engine)')
+
+    parser.add_argument('--discard-draws',
+                        action="store_true",
+                        help='Only keep the per-game cube maxima')
+
+    parser.add_argument('-e', '--engine', type=str, default='python',
+                        choices=['python', 'numpy'],
+                        help='Engine for analyzing the game log')
+
+    parser.add_argument('--snapshot',
+                        action="store_true",
+                        help='Load per-game maxima from a binary snapshot next to the puzzle')
+
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Parse and reduce the puzzle in this many processes')
+
+    parser.add_argument('--stats',
+                        action="store_true",
+                        help='Report top games, power percentiles and color maxima (python engine)')
+
+    parser.add_argument('-k', '--top-k', type=int, default=5,
+                        help='Number of most powerful games to report with --stats')
+
+    parser.add_argument('-f', '--follow',
+                        action="store_true",
+                        help='Keep reading games appended to the puzzle file')
     
     return parser.parse_args()
 
@@ -158,10 +716,59 @@ def parse_commandline():
 def main():
     game_log = GameLog()
     args = parse_commandline()
-    game_log.read_game_log(args.puzzle, args.debug)
-    game_log.analyze_game_log(12, 13, 14)
-    print(f'Sum of possible games IDs is: {game_log.sum}')
-    print(f'Sum of game powers is: {game_log.power_sum}')
+    if args.stats:
+        if args.top_k <= 0:
+            print('Error: --top-k must be at least 1')
+            sys.exit(0)
+        if args.workers > 1 or args.engine == 'numpy':
+            print('Error: --stats needs the python engine and a single worker')
+            sys.exit(0)
+        game_log.stats = GameStats(args.top_k)
+    if args.workers > 1:
+        unused = [flag for flag, given in (('--snapshot', args.snapshot),
+                                           ('--storage', args.storage),
+                                           ('--engine numpy', args.engine == 'numpy'),
+                                           ('--debug', args.debug),
+                                           ('--follow', args.follow)) if given]
+        if unused:
+            print(f'Error: {", ".join(unused)} cannot be combined with --workers')
+            sys.exit(0)
+    if args.storage is None:
+        args.storage = 'columnar' if args.engine == 'numpy' else 'objects'
+    elif args.storage == 'objects' and args.engine == 'numpy':
+        print('Error: the numpy engine needs columnar storage')
+        sys.exit(0)
+    if args.follow or args.puzzle == '-':
+        game_log.start_stream(12, 13, 14)
+        if args.puzzle == '-':
+            game_log.stream_game_log(sys.stdin, args.debug)
+            return
+        try:
+            with open(args.puzzle, 'r') as fptr:
+                game_log.stream_game_log(fptr, args.debug, follow=True)
+        except IOError:
+            print(f"Error: Could not open \'{args.puzzle}\'")
+            sys.exit(0)
+        return
+    if args.workers > 1:
+        game_log.analyze_in_parallel(args.puzzle, args.workers, 12, 13, 14)
+        game_log.report_unknown_colors()
+        game_log.print_totals()
+        return
+
+    if args.snapshot:
+        game_log.load_snapshot(args.puzzle, args.debug)
+    else:
+        game_log.read_game_log(args.puzzle, args.debug, args.storage,
+                               not args.discard_draws)
+    game_log.report_unknown_colors()
+    if args.engine == 'numpy':
+        game_log.analyze_game_log_numpy(12, 13, 14)
+    else:
+        game_log.analyze_game_log(12, 13, 14)
+    game_log.print_totals()
+    if game_log.stats is not None:
+        game_log.stats.print_stats()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
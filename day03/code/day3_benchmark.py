@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from day3_part2 import Schematic
+from day3_generate import generate_schematic
+
+
+def time_engine(filename, engine):
+    # Runs in a fresh worker process so ru_maxrss is this run's peak alone
+    schematic = Schematic()
+    start = time.perf_counter()
+    if engine == 'numpy':
+        schematic.analyze_schematic_numpy(filename, 0)
+        read_time = 0.0
+        tokens = 0
+    elif engine == 'store':
+        schematic.read_token_store(filename)
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        schematic.analyze_token_store(0)
+        tokens = len(schematic._store)
+    else:
+        schematic.read_schematic(filename)
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        schematic.analyze_schematic(0, engine)
+        tokens = len(schematic._tokens)
+    analyze_time = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return read_time, analyze_time, tokens, peak_rss, schematic.sum, schematic.gear_ratio
+
+
+def benchmark_sizes(sizes, engines, args):
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            filename = os.path.join(directory, f'schematic_{size}.txt')
+            with open(filename, 'w') as fptr:
+                generate_schematic(fptr, size, size, args.number_density,
+                                   args.symbol_density, args.gear_rate, args.seed)
+
+            print(f'{size}x{size}')
+            tokens = 0
+            expected = None
+            for engine in engines:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    (read_time, analyze_time, engine_tokens, peak_rss,
+                     total, gear_ratio) = pool.submit(time_engine, filename, engine).result()
+                # The numpy engine never builds tokens; reuse another engine's count
+                tokens = engine_tokens or tokens
+                if expected is None:
+                    expected = (total, gear_ratio)
+                elif expected != (total, gear_ratio):
+                    print(f'Error: the {engine} engine disagrees with the {engines[0]} engine')
+                    sys.exit(0)
+                elapsed = read_time + analyze_time
+                rate = f'{tokens / elapsed:12.0f}' if tokens and elapsed else f'{"-":>12}'
+                print(f'  {engine:6}: read {read_time:8.3f}s  analyze {analyze_time:8.3f}s  '
+                      f'{rate} tokens/s  peak RSS {peak_rss / 1024:8.1f} MiB')
+
+
+def parse_commandline():
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(description='Time day03 engines on growing synthetic schematics')
+
+    parser.add_argument('-s', '--sizes', type=str, default='100,300,1000,3000,10000',
+                        help='Comma separated side lengths of the square schematics')
+
+    parser.add_argument('-e', '--engines', type=str, default='index,store,numpy',
+                        help='Comma separated engines to time (scan, index, store, numpy); scan is quadratic')
+
+    parser.add_argument('-n', '--number-density', type=float, default=0.1,
+                        help='Chance that a cell starts a number')
+
+    parser.add_argument('-y', '--symbol-density', type=float, default=0.05,
+                        help='Chance that a cell holds a symbol')
+
+    parser.add_argument('-g', '--gear-rate', type=float, default=0.3,
+                        help='Fraction of symbols that are "*"')
+
+    parser.add_argument('--seed', type=int, default=2023,
+                        help='Seed for the random schematics')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_commandline()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    engines = args.engines.split(',')
+    for engine in engines:
+        if engine not in ('scan', 'index', 'store', 'numpy'):
+            print(f'Error: unknown engine {engine}')
+            sys.exit(0)
+    benchmark_sizes(sizes, engines, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import sys
+import random
+import argparse
+
+SYMBOLS = '#$%&+-/=@'
+
+
+def generate_row(generator, width, number_density, symbol_density, gear_rate):
+    # Numbers are one to three digits and always followed by a '.', so a
+    # row never holds two numbers that run into each other.
+    cells = []
+    while len(cells) < width:
+        roll = generator.random()
+        if roll < number_density:
+            length = min(generator.randint(1, 3), width - len(cells))
+            cells.append(str(generator.randint(1, 9)))
+            cells.extend(str(generator.randint(0, 9)) for _ in range(length - 1))
+            if len(cells) < width:
+                cells.append('.')
+        elif roll < number_density + symbol_density:
+            if generator.random() < gear_rate:
+                cells.append('*')
+            else:
+                cells.append(generator.choice(SYMBOLS))
+        else:
+            cells.append('.')
+    return ''.join(cells)
+
+
+def generate_schematic(fptr, width, height, number_density, symbol_density,
+                       gear_rate, seed):
+    generator = random.Random(seed)
+    for _ in range(height):
+        fptr.write(generate_row(generator, width, number_density,
+                                symbol_density, gear_rate))
+        fptr.write('\n')
+
+
+def parse_commandline():
+    # Instantiate the parser
+    parser = argparse.ArgumentParser(description='Generate a synthetic engine schematic')
+
+    parser.add_argument('-o', '--output', type=str, default='-',
+                        help='Filename for the schematic, - for stdout')
+
+    parser.add_argument('--width', type=int, default=140,
+                        help='Columns per row')
+
+    parser.add_argument('--height', type=int, default=140,
+                        help='Number of rows')
+
+    parser.add_argument('-n', '--number-density', type=float, default=0.1,
+                        help='Chance that a cell starts a number')
+
+    parser.add_argument('-y', '--symbol-density', type=float, default=0.05,
+                        help='Chance that a cell holds a symbol')
+
+    parser.add_argument('-g', '--gear-rate', type=float, default=0.3,
+                        help='Fraction of symbols that are "*"')
+
+    parser.add_argument('--seed', type=int, default=2023,
+                        help='Seed for the random schematic')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_commandline()
+    if args.number_density + args.symbol_density > 1:
+        print('Error: number and symbol densities add up to more than 1')
+        sys.exit(0)
+    if args.output == '-':
+        generate_schematic(sys.stdout, args.width, args.height, args.number_density,
+                           args.symbol_density, args.gear_rate, args.seed)
+        return
+    try:
+        with open(args.output, 'w') as fptr:
+            generate_schematic(fptr, args.width, args.height, args.number_density,
+                               args.symbol_density, args.gear_rate, args.seed)
+
+    except IOError:
+        print(f"Error: Could not open \'{args.output}\'")
+        sys.exit(0)
+
+if __name__ == '__main__':
+    main()
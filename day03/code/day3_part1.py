@@ -1,6 +1,14 @@
 import sys
 import re
 import argparse
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Token():
@@ -104,10 +112,77 @@ class NumberToken(Token):
         return f'NumberToken: {super().__str__()} Value={self.value} PartNumber:{self.is_part_number}'
 
 
+KIND_NUMBER = 0
+KIND_SYMBOL = 1
+KIND_GEAR = 2
+KIND_NAMES = ['NumberToken', 'SymbolToken', 'GearToken']
+SYMBOL_KINDS = {}
+
+
+class TokenStore():
+    # Struct-of-arrays token storage: one row per token across parallel
+    # typed arrays, in reading order, plus the first row of every line.
+    # Within a line the start and stop columns are therefore sorted, which
+    # lets neighbour lookups bisect instead of scanning.
+    def __init__(self):
+        self.kind = array('B')
+        self.line = array('I')
+        self.start = array('I')
+        self.stop = array('I')
+        self.value = array('Q')
+        self.symbol = array('I')
+        self.is_part_number = array('B')
+        self.line_offsets = array('I', [0, 0])
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add_token(self, kind, line, start, stop, value=0, symbol=0):
+        self.kind.append(kind)
+        self.line.append(line)
+        self.start.append(start)
+        self.stop.append(stop)
+        self.value.append(value)
+        self.symbol.append(symbol)
+        self.is_part_number.append(0)
+
+    def end_line(self):
+        self.line_offsets.append(len(self.kind))
+
+    def line_range(self, line):
+        if 1 <= line < len(self.line_offsets) - 1:
+            return self.line_offsets[line], self.line_offsets[line + 1]
+        return 0, 0
+
+    def view(self, index):
+        return TokenView(self, index)
+
+
+class TokenView():
+    # Read-only view of one TokenStore row for debugging
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)[self._index]
+
+    def __str__(self):
+        kind = KIND_NAMES[self.kind]
+        text = f'{kind}: Start={self.start} Stop={self.stop} Line={self.line}'
+        if self.kind == KIND_NUMBER:
+            return f'{text} Value={self.value} PartNumber:{bool(self.is_part_number)}'
+        return f'{text} {chr(self.symbol)}'
+
+
 class Schematic():   
     def __init__(self):
         self.sum = 0
         self._tokens = []
+        self._cells = {}
+        self._store = None
 
     def read_schematic(self, filename, debug):
         line_count = 0
@@ -130,6 +205,9 @@ class Schematic():
             sys.exit(0)
 
     def process_tokens(self, matched_string, start, stop, line_count ):
+        self._tokens.append(self.make_token(matched_string, start, stop, line_count))
+
+    def make_token(self, matched_string, start, stop, line_count):
         if matched_string.isdigit():
             token = NumberToken(int(matched_string), 
                                     start,
@@ -141,7 +219,7 @@ class Schematic():
                                 start,
                                 stop,
                                 line_count)
-        self._tokens.append(token)
+        return token
 
     def validate_token_as_part_number(self, token, debug):
         for other_token in self._tokens:
@@ -154,11 +232,239 @@ class Schematic():
                     print (f'  {other_token} Adjacent: {token.is_adjacent(other_token)} ')
                 return
 
-    def analyze_schematic(self, debug):
+    def tokenize_row(self, line, line_count):
+        tokens = []
+        cells = {}
+        for match in re.finditer(r'(\d+|[^\.])', line.rstrip()):
+            token = self.make_token(match.group(0),
+                                    match.start(),
+                                    match.end() - 1,
+                                    line_count)
+            tokens.append(token)
+            for column in range(token.start, token.stop + 1):
+                cells[(line_count, column)] = token
+        return tokens, cells
+
+    def stream_schematic(self, filename, debug):
+        # Only the previous, current and next rows are held.  A row is
+        # settled as soon as the row below it has been read, then dropped.
+        window = deque(maxlen=3)
+        line_count = 0
+        try:
+            with open(filename, 'r') as fptr:
+                for line in fptr:
+                    line_count += 1
+                    if debug:
+                        print (line, end='')
+                    window.append(self.tokenize_row(line, line_count))
+                    if len(window) > 1:
+                        self.settle_row(window[-2][0], window, debug)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        if window:
+            self.settle_row(window[-1][0], list(window)[-2:], debug)
+        self._cells = {}
+
+    def settle_row(self, tokens, window, debug):
+        self._cells = {}
+        for row_tokens, row_cells in window:
+            self._cells.update(row_cells)
+        for token in tokens:
+            self.validate_token_with_index(token, 0)
+            if (isinstance(token, NumberToken) and
+                token.is_part_number):
+                if debug:
+                    print (f'{token.value}')
+                self.sum += token.value
+
+    def load_grid(self, filename):
+        # The schematic as a 2D uint8 array padded with '.' so every row has
+        # the same width plus one spare column, which keeps digit runs from
+        # wrapping onto the next row once the grid is flattened.
+        try:
+            with open(filename, 'rb') as fptr:
+                rows = [line.rstrip() for line in fptr]
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        width = max((len(row) for row in rows), default=0) + 1
+        data = b''.join(row.ljust(width, b'.') for row in rows)
+        return np.frombuffer(data, dtype=np.uint8).reshape(len(rows), width)
+
+    def label_numbers(self, grid):
+        # Digit runs numbered 1..n in reading order, with each run's first
+        # and last flat position and its value
+        flat = grid.ravel()
+        digits = (flat >= ord('0')) & (flat <= ord('9'))
+        previous = np.concatenate(([False], digits[:-1]))
+        following = np.concatenate((digits[1:], [False]))
+        starts = np.flatnonzero(digits & ~previous)
+        stops = np.flatnonzero(digits & ~following)
+        labels = np.zeros(flat.shape, dtype=np.int64)
+        labels[starts] = 1
+        labels = np.cumsum(labels) * digits
+
+        lengths = stops - starts + 1
+        if len(lengths) and lengths.max() > 18:
+            values = np.array([int(flat[start:stop + 1].tobytes())
+                               for start, stop in zip(starts, stops)], dtype=object)
+        else:
+            positions = np.flatnonzero(digits)
+            exponents = stops[labels[positions] - 1] - positions
+            contributions = (flat[positions].astype(np.int64) - ord('0')) * 10 ** exponents
+            values = np.add.reduceat(contributions, np.cumsum(lengths) - lengths) \
+                if len(lengths) else np.zeros(0, dtype=np.int64)
+            if len(values) and values.max() >= 1 << 31:
+                # Part number sums could overflow int64
+                values = values.astype(object)
+        return labels.reshape(grid.shape), starts, stops, values
+
+    def part_number_mask(self, grid, labels, count):
+        symbols = ((grid != ord('.')) &
+                   ((grid < ord('0')) | (grid > ord('9'))))
+        dilated = symbols.copy()
+        dilated[1:] |= symbols[:-1]
+        dilated[:-1] |= symbols[1:]
+        around = dilated.copy()
+        around[:, 1:] |= dilated[:, :-1]
+        around[:, :-1] |= dilated[:, 1:]
+        touching = np.bincount(labels[around & (labels > 0)], minlength=count + 1)
+        return touching[1:] > 0
+
+    def analyze_schematic_numpy(self, filename, debug):
+        if np is None:
+            print("Error: the 'numpy' module is required for the numpy engine")
+            sys.exit(0)
+        grid = self.load_grid(filename)
+        labels, starts, stops, values = self.label_numbers(grid)
+        part_numbers = self.part_number_mask(grid, labels, len(values))
+        if debug:
+            print ('Part Number List')
+            for value in values[part_numbers]:
+                print (f'{value}')
+        self.sum = int(values[part_numbers].sum())
+
+    def analyze_in_parallel(self, filename, workers):
+        # Each band is sent with one halo row above and below so numbers and
+        # gears on its edge rows see their neighbours, but a band only
+        # counts the tokens on the rows it owns.
+        try:
+            with open(filename, 'r') as fptr:
+                lines = fptr.readlines()
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        band_size = max(1, -(-len(lines) // workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for start in range(0, len(lines), band_size):
+                stop = min(start + band_size, len(lines))
+                first = max(start - 1, 0)
+                futures.append(pool.submit(analyze_band, lines[first:stop + 1],
+                                           first + 1, start + 1, stop))
+            totals = [future.result() for future in futures]
+        self.sum = sum(totals)
+
+    def read_token_store(self, filename, debug=0):
+        store = TokenStore()
+        line_count = 0
+        try:
+            with open(filename, 'r') as fptr:
+                for line in fptr:
+                    line_count += 1
+                    if debug:
+                        print (line, end='')
+                    for match in re.finditer(r'(\d+|[^\.])', line.rstrip()):
+                        matched_string = match.group(0)
+                        if matched_string.isdigit():
+                            store.add_token(KIND_NUMBER, line_count, match.start(),
+                                            match.end() - 1, value=int(matched_string))
+                        else:
+                            store.add_token(SYMBOL_KINDS.get(matched_string, KIND_SYMBOL),
+                                            line_count, match.start(), match.end() - 1,
+                                            symbol=ord(matched_string))
+                    store.end_line()
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        except OverflowError:
+            print(f'Error: a number on line {line_count} is too large for the token store')
+            sys.exit(0)
+        self._store = store
+
+    def store_is_part_number(self, index):
+        # A symbol is one cell wide, so is_adjacent reduces to its column
+        # lying within one of the number on the line above, same or below
+        store = self._store
+        start = store.start
+        low = store.start[index] - 1
+        high = store.stop[index] + 1
+        line = store.line[index]
+        for other_line in (line - 1, line, line + 1):
+            first, last = store.line_range(other_line)
+            other = bisect_left(start, low, first, last)
+            while other < last and start[other] <= high:
+                if store.kind[other] != KIND_NUMBER:
+                    return True
+                other += 1
+        return False
+
+    def analyze_token_store(self, debug):
+        store = self._store
+        sum = 0
+        for index in range(len(store)):
+            if store.kind[index] == KIND_NUMBER and self.store_is_part_number(index):
+                store.is_part_number[index] = 1
+                sum += store.value[index]
+            if debug:
+                print(f'Token: {store.view(index)}')
+        self.sum = sum
+
+    def build_cell_index(self):
+        # Maps every (line, column) cell covered by a token to that token
+        cells = {}
+        for token in self._tokens:
+            for column in range(token.start, token.stop + 1):
+                cells[(token.line, column)] = token
+        self._cells = cells
+
+    def neighbours(self, token):
+        # Distinct tokens with a cell on the border around token
+        found = {}
+        for line in range(token.line - 1, token.line + 2):
+            for column in range(token.start - 1, token.stop + 2):
+                other_token = self._cells.get((line, column))
+                if other_token is not None and other_token is not token:
+                    found[id(other_token)] = other_token
+        return found.values()
+
+    def validate_token_with_index(self, token, debug):
+        if isinstance(token, NumberToken):
+            for other_token in self.neighbours(token):
+                if (isinstance(other_token, SymbolToken)
+                   and (token.is_adjacent(other_token))):
+                    token.is_part_number = True
+                    if debug:
+                        print (f'  {other_token} Adjacent: {token.is_adjacent(other_token)} ')
+                    return
+
+    def analyze_schematic(self, debug, engine='scan'):
+        if engine == 'index':
+            self.build_cell_index()
         for token in self._tokens:
             if debug:
                 print(f'Token: {token}')
-            self.validate_token_as_part_number(token, debug)
+            if engine == 'index':
+                self.validate_token_with_index(token, debug)
+            else:
+                self.validate_token_as_part_number(token, debug)
 
         sum = 0
         for token in self._tokens:
@@ -182,6 +488,28 @@ class Schematic():
         self._sum = sum
 
 
+def band_tokens(schematic, lines, first_line):
+    tokens = []
+    for line_count, line in enumerate(lines, first_line):
+        row_tokens, row_cells = schematic.tokenize_row(line, line_count)
+        tokens.extend(row_tokens)
+        schematic._cells.update(row_cells)
+    return tokens
+
+
+def analyze_band(lines, first_line, owned_start, owned_stop):
+    # Runs in a worker process; returns the part number sum of owned rows
+    schematic = Schematic()
+    sum = 0
+    for token in band_tokens(schematic, lines, first_line):
+        if owned_start <= token.line <= owned_stop:
+            schematic.validate_token_with_index(token, 0)
+            if (isinstance(token, NumberToken) and
+                token.is_part_number):
+                sum += token.value
+    return sum
+
+
 def parse_commandline():
     # Instantiate the parser
     parser = argparse.ArgumentParser(description='Optional app description')
@@ -192,6 +520,17 @@ def parse_commandline():
     parser.add_argument('-d', '--debug', 
                         action="store_true",
                         help='Turn on verbosity')
+
+    parser.add_argument('-s', '--stream',
+                        action="store_true",
+                        help='Analyze three rows at a time instead of loading the whole schematic')
+
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Analyze horizontal bands of the schematic in this many processes')
+
+    parser.add_argument('-e', '--engine', type=str, default='scan',
+                        choices=['scan', 'index', 'numpy', 'store'],
+                        help='Compare every token pair, probe a cell index or use numpy masks')
     
     return parser.parse_args()
 
@@ -199,9 +538,20 @@ def parse_commandline():
 def main():
     schematic = Schematic()
     args = parse_commandline()
-    schematic.read_schematic(args.puzzle, 0)
-    schematic.analyze_schematic(args.debug)
-    if args.debug:
+    if args.stream:
+        schematic.stream_schematic(args.puzzle, args.debug)
+    elif args.workers > 1:
+        schematic.analyze_in_parallel(args.puzzle, args.workers)
+    elif args.engine == 'numpy':
+        schematic.analyze_schematic_numpy(args.puzzle, args.debug)
+    elif args.engine == 'store':
+        schematic.read_token_store(args.puzzle)
+        schematic.analyze_token_store(args.debug)
+    else:
+        schematic.read_schematic(args.puzzle, 0)
+        schematic.analyze_schematic(args.debug, args.engine)
+    if (args.debug and not args.stream and args.workers <= 1 and
+        args.engine not in ('numpy', 'store')):
         print ('Part Number List')
         schematic.print_part_numbers()
 
@@ -1,6 +1,14 @@
 import sys
 import re
 import argparse
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Token():
@@ -121,11 +129,81 @@ class NumberToken(Token):
         return f'NumberToken: {super().__str__()} Value={self.value} PartNumber:{self.is_part_number}'
 
 
+KIND_NUMBER = 0
+KIND_SYMBOL = 1
+KIND_GEAR = 2
+KIND_NAMES = ['NumberToken', 'SymbolToken', 'GearToken']
+SYMBOL_KINDS = {'*': KIND_GEAR}
+
+
+class TokenStore():
+    # Struct-of-arrays token storage: one row per token across parallel
+    # typed arrays, in reading order, plus the first row of every line.
+    # Within a line the start and stop columns are therefore sorted, which
+    # lets neighbour lookups bisect instead of scanning.
+    def __init__(self):
+        self.kind = array('B')
+        self.line = array('I')
+        self.start = array('I')
+        self.stop = array('I')
+        self.value = array('Q')
+        self.symbol = array('I')
+        self.is_part_number = array('B')
+        self.line_offsets = array('I', [0, 0])
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add_token(self, kind, line, start, stop, value=0, symbol=0):
+        self.kind.append(kind)
+        self.line.append(line)
+        self.start.append(start)
+        self.stop.append(stop)
+        self.value.append(value)
+        self.symbol.append(symbol)
+        self.is_part_number.append(0)
+
+    def end_line(self):
+        self.line_offsets.append(len(self.kind))
+
+    def line_range(self, line):
+        if 1 <= line < len(self.line_offsets) - 1:
+            return self.line_offsets[line], self.line_offsets[line + 1]
+        return 0, 0
+
+    def view(self, index):
+        return TokenView(self, index)
+
+
+class TokenView():
+    # Read-only view of one TokenStore row for debugging
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)[self._index]
+
+    def __str__(self):
+        kind = KIND_NAMES[self.kind]
+        text = f'{kind}: Start={self.start} Stop={self.stop} Line={self.line}'
+        if self.kind == KIND_NUMBER:
+            return f'{text} Value={self.value} PartNumber:{bool(self.is_part_number)}'
+        return f'{text} {chr(self.symbol)}'
+
+
 class Schematic():   
     def __init__(self):
         self.sum = 0
         self.gear_ratio = 0
         self._tokens = []
+        self._cells = {}
+        self._store = None
+        self._rows = []
+        self._tokens_stale = False
+        self._symbol_index = None
 
     def read_schematic(self, filename, debug=0):
         line_count = 0
@@ -148,6 +226,9 @@ class Schematic():
             sys.exit(0)
 
     def process_tokens(self, matched_string, start, stop, line_count ):
+        self._tokens.append(self.make_token(matched_string, start, stop, line_count))
+
+    def make_token(self, matched_string, start, stop, line_count):
         if matched_string.isdigit():
             token = NumberToken(int(matched_string), 
                                     start,
@@ -164,7 +245,7 @@ class Schematic():
                                     start,
                                     stop,
                                     line_count)
-        self._tokens.append(token)
+        return token
 
     def validate_token_as_part_number(self, token, debug=0):
         if isinstance(token, NumberToken):
@@ -188,12 +269,320 @@ class Schematic():
             if len(factors) == 2:
                 token.ratio = factors[0] * factors [1]
 
-    def analyze_schematic(self, debug):
+    def tokenize_row(self, line, line_count):
+        tokens = []
+        cells = {}
+        for match in re.finditer(r'(\d+|[^\.])', line.rstrip()):
+            token = self.make_token(match.group(0),
+                                    match.start(),
+                                    match.end() - 1,
+                                    line_count)
+            tokens.append(token)
+            for column in range(token.start, token.stop + 1):
+                cells[(line_count, column)] = token
+        return tokens, cells
+
+    def stream_schematic(self, filename, debug):
+        # Only the previous, current and next rows are held.  A row is
+        # settled as soon as the row below it has been read, then dropped.
+        window = deque(maxlen=3)
+        line_count = 0
+        try:
+            with open(filename, 'r') as fptr:
+                for line in fptr:
+                    line_count += 1
+                    if debug:
+                        print (line, end='')
+                    window.append(self.tokenize_row(line, line_count))
+                    if len(window) > 1:
+                        self.settle_row(window[-2][0], window, debug)
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        if window:
+            self.settle_row(window[-1][0], list(window)[-2:], debug)
+        self._cells = {}
+
+    def settle_row(self, tokens, window, debug):
+        self._cells = {}
+        for row_tokens, row_cells in window:
+            self._cells.update(row_cells)
+        for token in tokens:
+            self.validate_token_with_index(token, 0)
+            self.check_gear_ratio_with_index(token, 0)
+            if (isinstance(token, NumberToken) and
+                token.is_part_number):
+                if debug:
+                    print (f'{token.value}')
+                self.sum += token.value
+
+            if isinstance(token, GearToken):
+                self.gear_ratio += token.ratio
+
+    def load_grid(self, filename):
+        # The schematic as a 2D uint8 array padded with '.' so every row has
+        # the same width plus one spare column, which keeps digit runs from
+        # wrapping onto the next row once the grid is flattened.
+        try:
+            with open(filename, 'rb') as fptr:
+                rows = [line.rstrip() for line in fptr]
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        width = max((len(row) for row in rows), default=0) + 1
+        data = b''.join(row.ljust(width, b'.') for row in rows)
+        return np.frombuffer(data, dtype=np.uint8).reshape(len(rows), width)
+
+    def label_numbers(self, grid):
+        # Digit runs numbered 1..n in reading order, with each run's first
+        # and last flat position and its value
+        flat = grid.ravel()
+        digits = (flat >= ord('0')) & (flat <= ord('9'))
+        previous = np.concatenate(([False], digits[:-1]))
+        following = np.concatenate((digits[1:], [False]))
+        starts = np.flatnonzero(digits & ~previous)
+        stops = np.flatnonzero(digits & ~following)
+        labels = np.zeros(flat.shape, dtype=np.int64)
+        labels[starts] = 1
+        labels = np.cumsum(labels) * digits
+
+        lengths = stops - starts + 1
+        if len(lengths) and lengths.max() > 18:
+            values = np.array([int(flat[start:stop + 1].tobytes())
+                               for start, stop in zip(starts, stops)], dtype=object)
+        else:
+            positions = np.flatnonzero(digits)
+            exponents = stops[labels[positions] - 1] - positions
+            contributions = (flat[positions].astype(np.int64) - ord('0')) * 10 ** exponents
+            values = np.add.reduceat(contributions, np.cumsum(lengths) - lengths) \
+                if len(lengths) else np.zeros(0, dtype=np.int64)
+            if len(values) and values.max() >= 1 << 31:
+                # Part number sums could overflow int64
+                values = values.astype(object)
+        return labels.reshape(grid.shape), starts, stops, values
+
+    def part_number_mask(self, grid, labels, count):
+        symbols = ((grid != ord('.')) &
+                   ((grid < ord('0')) | (grid > ord('9'))))
+        dilated = symbols.copy()
+        dilated[1:] |= symbols[:-1]
+        dilated[:-1] |= symbols[1:]
+        around = dilated.copy()
+        around[:, 1:] |= dilated[:, :-1]
+        around[:, :-1] |= dilated[:, 1:]
+        touching = np.bincount(labels[around & (labels > 0)], minlength=count + 1)
+        return touching[1:] > 0
+
+    def gear_ratio_sum(self, grid, labels, starts, stops, values):
+        # Labels in the 3x3 cells around each '*', kept only when the number
+        # starts or stops within a column of the gear as is_adjacent requires
+        gear_rows, gear_columns = np.nonzero(grid == ord('*'))
+        if len(gear_rows) == 0:
+            return 0
+        width = grid.shape[1]
+        padded = np.pad(labels, 1)
+        neighbours = np.stack([padded[gear_rows + 1 + row, gear_columns + 1 + column]
+                               for row in (-1, 0, 1) for column in (-1, 0, 1)], axis=1)
+        start_columns = np.concatenate(([0], starts % width))[neighbours]
+        stop_columns = np.concatenate(([0], stops % width))[neighbours]
+        columns = gear_columns[:, None]
+        adjacent = ((neighbours > 0) &
+                    ((np.abs(start_columns - columns) <= 1) |
+                     (np.abs(stop_columns - columns) <= 1)))
+        neighbours = np.sort(np.where(adjacent, neighbours, 0), axis=1)
+        distinct = (neighbours > 0) & np.concatenate(
+            (np.ones((len(neighbours), 1), dtype=bool),
+             neighbours[:, 1:] != neighbours[:, :-1]), axis=1)
+        gears = distinct.sum(axis=1) == 2
+        if not gears.any():
+            return 0
+        first = np.where(neighbours > 0, neighbours, len(values) + 1).min(axis=1)[gears]
+        second = neighbours.max(axis=1)[gears]
+        first_values = values[first - 1]
+        second_values = values[second - 1]
+        if (first_values.dtype != object and
+            int(first_values.max()) * int(second_values.max()) * len(first_values) >= 1 << 63):
+            # The summed products could overflow int64
+            first_values = first_values.astype(object)
+            second_values = second_values.astype(object)
+        return int((first_values * second_values).sum())
+
+    def analyze_schematic_numpy(self, filename, debug):
+        if np is None:
+            print("Error: the 'numpy' module is required for the numpy engine")
+            sys.exit(0)
+        grid = self.load_grid(filename)
+        labels, starts, stops, values = self.label_numbers(grid)
+        part_numbers = self.part_number_mask(grid, labels, len(values))
+        if debug:
+            print ('Part Number List')
+            for value in values[part_numbers]:
+                print (f'{value}')
+        self.sum = int(values[part_numbers].sum())
+        self.gear_ratio = self.gear_ratio_sum(grid, labels, starts, stops, values)
+
+    def analyze_in_parallel(self, filename, workers):
+        # Each band is sent with one halo row above and below so numbers and
+        # gears on its edge rows see their neighbours, but a band only
+        # counts the tokens on the rows it owns.
+        try:
+            with open(filename, 'r') as fptr:
+                lines = fptr.readlines()
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+
+        band_size = max(1, -(-len(lines) // workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for start in range(0, len(lines), band_size):
+                stop = min(start + band_size, len(lines))
+                first = max(start - 1, 0)
+                futures.append(pool.submit(analyze_band, lines[first:stop + 1],
+                                           first + 1, start + 1, stop))
+            totals = [future.result() for future in futures]
+        self.sum = sum(total[0] for total in totals)
+        self.gear_ratio = sum(total[1] for total in totals)
+
+    def read_token_store(self, filename, debug=0):
+        store = TokenStore()
+        line_count = 0
+        try:
+            with open(filename, 'r') as fptr:
+                for line in fptr:
+                    line_count += 1
+                    if debug:
+                        print (line, end='')
+                    for match in re.finditer(r'(\d+|[^\.])', line.rstrip()):
+                        matched_string = match.group(0)
+                        if matched_string.isdigit():
+                            store.add_token(KIND_NUMBER, line_count, match.start(),
+                                            match.end() - 1, value=int(matched_string))
+                        else:
+                            store.add_token(SYMBOL_KINDS.get(matched_string, KIND_SYMBOL),
+                                            line_count, match.start(), match.end() - 1,
+                                            symbol=ord(matched_string))
+                    store.end_line()
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        except OverflowError:
+            print(f'Error: a number on line {line_count} is too large for the token store')
+            sys.exit(0)
+        self._store = store
+
+    def store_is_part_number(self, index):
+        # A symbol is one cell wide, so is_adjacent reduces to its column
+        # lying within one of the number on the line above, same or below
+        store = self._store
+        start = store.start
+        low = store.start[index] - 1
+        high = store.stop[index] + 1
+        line = store.line[index]
+        for other_line in (line - 1, line, line + 1):
+            first, last = store.line_range(other_line)
+            other = bisect_left(start, low, first, last)
+            while other < last and start[other] <= high:
+                if store.kind[other] != KIND_NUMBER:
+                    return True
+                other += 1
+        return False
+
+    def store_gear_ratio(self, index):
+        # Numbers count as in is_adjacent: their start or stop column must
+        # be within one of the gear on the line above, same or below
+        store = self._store
+        start = store.start
+        stop = store.stop
+        column = start[index]
+        line = store.line[index]
+        factors = []
+        for other_line in (line - 1, line, line + 1):
+            first, last = store.line_range(other_line)
+            other = bisect_left(stop, column - 1, first, last)
+            while other < last and start[other] <= column + 1:
+                if (store.kind[other] == KIND_NUMBER and
+                    ((column - 1 <= start[other] <= column + 1) or
+                     (column - 1 <= stop[other] <= column + 1))):
+                    factors.append(store.value[other])
+                other += 1
+        if len(factors) == 2:
+            return factors[0] * factors[1]
+        return 0
+
+    def analyze_token_store(self, debug):
+        store = self._store
+        sum = 0
+        gear_ratio = 0
+        for index in range(len(store)):
+            kind = store.kind[index]
+            if kind == KIND_NUMBER and self.store_is_part_number(index):
+                store.is_part_number[index] = 1
+                sum += store.value[index]
+            elif kind == KIND_GEAR:
+                gear_ratio += self.store_gear_ratio(index)
+            if debug:
+                print(f'Token: {store.view(index)}')
+        self.sum = sum
+        self.gear_ratio = gear_ratio
+
+    def build_cell_index(self):
+        # Maps every (line, column) cell covered by a token to that token
+        cells = {}
+        for token in self._tokens:
+            for column in range(token.start, token.stop + 1):
+                cells[(token.line, column)] = token
+        self._cells = cells
+
+    def neighbours(self, token):
+        # Distinct tokens with a cell on the border around token
+        found = {}
+        for line in range(token.line - 1, token.line + 2):
+            for column in range(token.start - 1, token.stop + 2):
+                other_token = self._cells.get((line, column))
+                if other_token is not None and other_token is not token:
+                    found[id(other_token)] = other_token
+        return found.values()
+
+    def validate_token_with_index(self, token, debug=0):
+        if isinstance(token, NumberToken):
+            for other_token in self.neighbours(token):
+                if (isinstance(other_token, SymbolToken)
+                   and (token.is_adjacent(other_token))):
+                    token.is_part_number = True
+                    if debug:
+                        print (f'  {other_token} Adjacent: {token.is_adjacent(other_token)} ')
+                    return
+
+    def check_gear_ratio_with_index(self, token, debug):
+        # Probing the 3x3 cells finds every number touching the gear; the
+        # is_adjacent filter keeps the scan engine's start/stop semantics.
+        factors = []
+        if isinstance(token, GearToken):
+            for other_token in self.neighbours(token):
+                if (isinstance(other_token, NumberToken)
+                   and (token.is_adjacent(other_token))):
+                    factors.append(other_token.value)
+            if len(factors) == 2:
+                token.ratio = factors[0] * factors [1]
+
+    def analyze_schematic(self, debug, engine='scan'):
+        if engine == 'index':
+            self.build_cell_index()
         for token in self._tokens:
             if debug:
                 print(f'Token: {token}')
-            self.validate_token_as_part_number(token, 0)
-            self.check_gear_ratio(token, debug)
+            if engine == 'index':
+                self.validate_token_with_index(token, 0)
+                self.check_gear_ratio_with_index(token, debug)
+            else:
+                self.validate_token_as_part_number(token, 0)
+                self.check_gear_ratio(token, debug)
 
         sum = 0
         gear_ratio = 0
@@ -208,7 +597,159 @@ class Schematic():
         self.sum = sum
         self.gear_ratio = gear_ratio
 
+    def load_editable(self, filename):
+        # Analyzes the schematic once and keeps its rows and cell index so
+        # set_cell can patch the totals afterwards.
+        self.read_schematic(filename)
+        try:
+            with open(filename, 'r') as fptr:
+                self._rows = [line.rstrip() for line in fptr]
+
+        except IOError:
+            print(f"Error: Could not open \'{filename}\'")
+            sys.exit(0)
+        self.analyze_schematic(0, 'index')
+
+    def contribution(self, token):
+        if (isinstance(token, NumberToken) and
+            token.is_part_number):
+            return token.value, 0
+        if isinstance(token, GearToken):
+            return 0, token.ratio
+        return 0, 0
+
+    def tokens_in_region(self, first_line, last_line, low, high):
+        found = {}
+        for line in range(first_line, last_line + 1):
+            for column in range(low, high + 1):
+                token = self._cells.get((line, column))
+                if token is not None:
+                    found[id(token)] = token
+        return found.values()
+
+    def set_cell(self, line, column, ch):
+        # Only the tokens touching the edited cell are re-tokenized, and
+        # only tokens in the 3x3-expanded dirty region are re-evaluated;
+        # sum and gear_ratio are adjusted by the change in their share.
+        if len(ch) != 1 or ch == '\n':
+            print(f'Error: cell value must be a single character, not "{ch}"')
+            sys.exit(0)
+        if line < 1 or column < 0:
+            print(f'Error: line {line} column {column} is outside the schematic')
+            sys.exit(0)
+        while len(self._rows) < line:
+            self._rows.append('')
+        row = self._rows[line - 1].ljust(column + 1, '.')
+        self._rows[line - 1] = (row[:column] + ch + row[column + 1:]).rstrip()
+
+        low = high = column
+        for token in self.tokens_in_region(line, line, column - 1, column + 1):
+            low = min(low, token.start)
+            high = max(high, token.stop)
+
+        for token in list(self.tokens_in_region(line, line, low, high)):
+            part_sum, gear_ratio = self.contribution(token)
+            self.sum -= part_sum
+            self.gear_ratio -= gear_ratio
+            for other_column in range(token.start, token.stop + 1):
+                del self._cells[(line, other_column)]
+
+        segment = self._rows[line - 1][low:high + 1]
+        for match in re.finditer(r'(\d+|[^\.])', segment):
+            token = self.make_token(match.group(0),
+                                    low + match.start(),
+                                    low + match.end() - 1,
+                                    line)
+            for other_column in range(token.start, token.stop + 1):
+                self._cells[(line, other_column)] = token
+
+        for token in self.tokens_in_region(line - 1, line + 1, low - 1, high + 1):
+            part_sum, gear_ratio = self.contribution(token)
+            if isinstance(token, NumberToken):
+                token.is_part_number = False
+                self.validate_token_with_index(token)
+            if isinstance(token, GearToken):
+                token.ratio = 0
+                self.check_gear_ratio_with_index(token, 0)
+            new_part_sum, new_gear_ratio = self.contribution(token)
+            self.sum += new_part_sum - part_sum
+            self.gear_ratio += new_gear_ratio - gear_ratio
+        self._tokens_stale = True
+        self._symbol_index = None
+
+    def sync_tokens(self):
+        # After edits the cell index is authoritative; rebuild the token list
+        found = {}
+        for token in self._cells.values():
+            found[id(token)] = token
+        self._tokens = sorted(found.values(), key=lambda token: (token.line, token.start))
+        self._tokens_stale = False
+
+    def build_symbol_index(self):
+        # One pass over the numbers files each one under every symbol on
+        # its border, so neighbourhood queries never rescan the tokens.
+        # Adjacency is the part number rule: any of the eight neighbours.
+        if self._tokens_stale:
+            self.sync_tokens()
+        if not self._cells:
+            self.build_cell_index()
+        entries = {}
+        for token in self._tokens:
+            if isinstance(token, SymbolToken):
+                entries[id(token)] = (token, [])
+        for token in self._tokens:
+            if isinstance(token, NumberToken):
+                for other_token in self.neighbours(token):
+                    if isinstance(other_token, SymbolToken):
+                        entries[id(other_token)][1].append(token)
+        by_symbol = {}
+        for entry in entries.values():
+            by_symbol.setdefault(entry[0].symbol, []).append(entry)
+        self._symbol_index = by_symbol
+
+    def symbol_entries(self, symbol=None):
+        if self._symbol_index is None:
+            self.build_symbol_index()
+        if symbol is not None:
+            return self._symbol_index.get(symbol, [])
+        return [entry for entries in self._symbol_index.values() for entry in entries]
+
+    def numbers_adjacent_to(self, symbol):
+        # Distinct numbers touching at least one symbol of this type
+        found = {}
+        for _, numbers in self.symbol_entries(symbol):
+            for number in numbers:
+                found[id(number)] = number
+        return sorted(found.values(), key=lambda token: (token.line, token.start))
+
+    def symbols_with_neighbours(self, count, symbol=None):
+        # (symbol token, product) for symbols with exactly count numbers
+        matches = []
+        for token, numbers in self.symbol_entries(symbol):
+            if len(numbers) == count:
+                product = 1
+                for number in numbers:
+                    product *= number.value
+                matches.append((token, product))
+        return matches
+
+    def gear_rule_sum(self, symbol, count):
+        return sum(product for _, product in self.symbols_with_neighbours(count, symbol))
+
+    def symbol_totals(self):
+        # symbol -> (symbols of that type, sum of the distinct numbers they touch)
+        if self._symbol_index is None:
+            self.build_symbol_index()
+        totals = {}
+        for symbol in sorted(self._symbol_index):
+            numbers = self.numbers_adjacent_to(symbol)
+            totals[symbol] = (len(self._symbol_index[symbol]),
+                              sum(number.value for number in numbers))
+        return totals
+
     def print_part_numbers(self):
+        if self._tokens_stale:
+            self.sync_tokens()
         for token in self._tokens:
             if (isinstance(token, NumberToken) and
                 token.is_part_number):
@@ -231,6 +772,32 @@ class Schematic():
         self._gear_ratio = gear_ratio
 
 
+def band_tokens(schematic, lines, first_line):
+    tokens = []
+    for line_count, line in enumerate(lines, first_line):
+        row_tokens, row_cells = schematic.tokenize_row(line, line_count)
+        tokens.extend(row_tokens)
+        schematic._cells.update(row_cells)
+    return tokens
+
+
+def analyze_band(lines, first_line, owned_start, owned_stop):
+    # Runs in a worker process; returns the totals for the owned rows
+    schematic = Schematic()
+    sum = 0
+    gear_ratio = 0
+    for token in band_tokens(schematic, lines, first_line):
+        if owned_start <= token.line <= owned_stop:
+            schematic.validate_token_with_index(token, 0)
+            schematic.check_gear_ratio_with_index(token, 0)
+            if (isinstance(token, NumberToken) and
+                token.is_part_number):
+                sum += token.value
+            if isinstance(token, GearToken):
+                gear_ratio += token.ratio
+    return sum, gear_ratio
+
+
 def parse_commandline():
     # Instantiate the parser
     parser = argparse.ArgumentParser(description='Optional app description')
@@ -241,6 +808,29 @@ def parse_commandline():
     parser.add_argument('-d', '--debug', 
                         action="store_true",
                         help='Turn on verbosity')
+
+    parser.add_argument('-s', '--stream',
+                        action="store_true",
+                        help='Analyze three rows at a time instead of loading the whole schematic')
+
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Analyze horizontal bands of the schematic in this many processes')
+
+    parser.add_argument('--edit', type=str, action='append', default=[],
+                        metavar='LINE,COLUMN,CHAR',
+                        help='Set a cell after loading and report the updated totals')
+
+    parser.add_argument('-g', '--gear-rule', type=str, action='append', default=[],
+                        metavar='SYMBOL,COUNT',
+                        help='Sum the products of SYMBOLs with exactly COUNT adjacent numbers')
+
+    parser.add_argument('-t', '--symbol-totals',
+                        action="store_true",
+                        help='Report the symbols and adjacent number sum per symbol type')
+
+    parser.add_argument('-e', '--engine', type=str, default='scan',
+                        choices=['scan', 'index', 'numpy', 'store'],
+                        help='Compare every token pair, probe a cell index or use numpy masks')
     
     return parser.parse_args()
 
@@ -248,9 +838,49 @@ def parse_commandline():
 def main():
     schematic = Schematic()
     args = parse_commandline()
-    schematic.read_schematic(args.puzzle)
-    schematic.analyze_schematic(args.debug)
-    if args.debug:
+    if args.edit:
+        schematic.load_editable(args.puzzle)
+        for edit in args.edit:
+            fields = edit.split(',', 2)
+            if (len(fields) != 3 or
+                not fields[0].lstrip('-').isdigit() or
+                not fields[1].lstrip('-').isdigit()):
+                print(f'Error: bad edit {edit}, expected LINE,COLUMN,CHAR')
+                sys.exit(0)
+            line, column, ch = fields
+            schematic.set_cell(int(line), int(column), ch)
+            print(f'Set line {line} column {column} to "{ch}": '
+                  f'sum = {schematic.sum} gear_ratio = {schematic.gear_ratio}')
+        return
+    if args.gear_rule or args.symbol_totals:
+        schematic.read_schematic(args.puzzle)
+        schematic.build_symbol_index()
+        for rule in args.gear_rule:
+            fields = rule.rsplit(',', 1)
+            if len(fields) != 2 or len(fields[0]) != 1 or not fields[1].isdigit():
+                print(f'Error: bad gear rule {rule}, expected SYMBOL,COUNT')
+                sys.exit(0)
+            symbol, count = fields
+            print(f'Symbol "{symbol}" with {count} numbers: '
+                  f'{schematic.gear_rule_sum(symbol, int(count))}')
+        if args.symbol_totals:
+            for symbol, (count, total) in schematic.symbol_totals().items():
+                print(f'Symbol "{symbol}": {count} symbols, adjacent number sum = {total}')
+        return
+    if args.stream:
+        schematic.stream_schematic(args.puzzle, args.debug)
+    elif args.workers > 1:
+        schematic.analyze_in_parallel(args.puzzle, args.workers)
+    elif args.engine == 'numpy':
+        schematic.analyze_schematic_numpy(args.puzzle, args.debug)
+    elif args.engine == 'store':
+        schematic.read_token_store(args.puzzle)
+        schematic.analyze_token_store(args.debug)
+    else:
+        schematic.read_schematic(args.puzzle)
+        schematic.analyze_schematic(args.debug, args.engine)
+    if (args.debug and not args.stream and args.workers <= 1 and
+        args.engine not in ('numpy', 'store')):
         print ('Part Number List')
         schematic.print_part_numbers()
         print ('Part Number List')